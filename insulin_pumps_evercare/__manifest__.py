@@ -9,25 +9,32 @@
     'license': 'Other proprietary',
     'development_status': 'Production/Stable',
     'depends': ['base', 'stock', 'website', 'mail'],
+    'external_dependencies': {
+        'python': ['numpy'],
+    },
     'data': [
         'security/insulin_pumps_security.xml',
         'security/ir.model.access.csv',
         'data/ir_sequence_data.xml',
         'data/ir_cron_data.xml',
+        'data/mail_template_data.xml',
         'data/product_data.xml',
         'data/stock_location_data.xml',
         'data/training_location_data.xml',
         'data/stock_lot_data.xml',
         'data/stock_quant_data.xml',
         'data/res_partner_data.xml',
+        'data/assignment_log_data.xml',
         'data/device_assignments_data.xml',
         'data/consumables_data.xml',
-        'data/assignment_log_data.xml',
         'data/res_config_settings_data.xml',
+        'data/device_status_counter_data.xml',
         'views/res_partner_views.xml',
         'views/stock_lot_views.xml',
         'views/insulin_pumps_views.xml',
         'views/replace_device_wizard_views.xml',
+        'views/patient_import_wizard_views.xml',
+        'views/assignment_usage_wizard_views.xml',
         'views/website_templates.xml',
     ],
     'installable': True,
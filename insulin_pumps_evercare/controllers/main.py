@@ -1,5 +1,69 @@
-from odoo import http
-from odoo.http import request
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from werkzeug.wsgi import wrap_file
+
+from odoo import fields, http
+from odoo.http import content_disposition, request
+
+REQUIRED_FIELDS = [
+    'patient_name',
+    'main_pump_serial',
+    'contact_phone',
+    'travel_start_date',
+    'travel_end_date',
+    'destination',
+]
+
+
+class TokenBucketLimiter:
+    """In-memory token bucket rate limiter, one bucket per key.
+
+    Buckets live in the worker process, without any database round-trip:
+    each worker (or each thread-mode server) enforces the limit on the
+    traffic it serves and starts over when it is recycled, so with N
+    workers up to N times the configured rate gets through. It is a cheap
+    first filter against bursts and bots; the limit shared by all workers
+    is enforced on the staged submissions.
+    """
+
+    def __init__(self, capacity, refill_per_second, max_keys=10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, *keys):
+        """Take one token from the bucket of every key, if all have one."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            levels = []
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (self.capacity, now))
+                levels.append(min(self.capacity, tokens + (now - updated) * self.refill_per_second))
+            if any(tokens < 1 for tokens in levels):
+                return False
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1, now)
+            return True
+
+    def _prune(self, now):
+        """Drop buckets that have refilled completely."""
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.refill_per_second >= self.capacity:
+                del self._buckets[key]
+
+
+# 5 submissions at once, then one every 2 minutes per IP address and per serial
+holiday_pump_limiter = TokenBucketLimiter(capacity=5, refill_per_second=1 / 120)
+# The same rate across workers: 5 staged submissions per 10 minutes
+SUBMISSION_LIMIT = 5
+SUBMISSION_WINDOW = timedelta(minutes=10)
 
 
 class HolidayPumpController(http.Controller):
@@ -7,41 +71,89 @@ class HolidayPumpController(http.Controller):
     @http.route(['/holiday-pump-request'], type='http', auth="public", website=True)
     def holiday_pump_request_form(self, **post):
         if post:
-            # Validate Serial Number
+            # Cheap input validation before touching the database
+            missing = [name for name in REQUIRED_FIELDS if not (post.get(name) or '').strip()]
+            if missing:
+                return request.render("insulin_pumps_evercare.holiday_pump_request_error", {
+                    'error_msg': "Please fill in all required fields."
+                })
+            try:
+                start_date = fields.Date.to_date(post['travel_start_date'])
+                end_date = fields.Date.to_date(post['travel_end_date'])
+            except ValueError:
+                start_date = end_date = None
+            if not start_date or not end_date or end_date < start_date:
+                return request.render("insulin_pumps_evercare.holiday_pump_request_error", {
+                    'error_msg': "Please enter valid travel dates."
+                })
+
             sn = post.get('main_pump_serial', '').strip()
-            lot = request.env['stock.lot'].sudo().search([
-                ('name', '=ilike', sn),
-                ('is_insulin_pump', '=', True),
-                ('pump_state', '=', 'assigned')
-            ], limit=1)
-            
-            if not lot:
+            ip_address = request.httprequest.remote_addr
+            Submission = request.env['insulin.holiday.pump.submission'].sudo()
+            if (
+                not holiday_pump_limiter.allow(('ip', ip_address), ('serial', sn.upper()))
+                or Submission._is_rate_limited(ip_address, sn, SUBMISSION_LIMIT, SUBMISSION_WINDOW)
+            ):
+                return request.render("insulin_pumps_evercare.holiday_pump_request_error", {
+                    'error_msg': "Too many requests have been submitted. Please try again later."
+                })
+
+            # Validate Serial Number (indexed lookup)
+            lot = request.env['stock.lot'].sudo()._find_pumps_by_serials([sn]).get(sn.upper())
+
+            if not lot or lot.pump_state != 'assigned':
                 return request.render("insulin_pumps_evercare.holiday_pump_request_error", {
                     'error_msg': f"Serial Number '{sn}' not found or not currently assigned to a patient."
                 })
-            
-            # Create the request record
-            vals = {
+
+            # Stage the submission; a scheduled action creates the request
+            # record and notifies the helpdesk
+            Submission.create({
                 'patient_name': post.get('patient_name'),
                 'main_pump_serial': sn,
                 'contact_phone': post.get('contact_phone'),
                 'contact_email': post.get('contact_email'),
-                'travel_start_date': post.get('travel_start_date'),
-                'travel_end_date': post.get('travel_end_date'),
+                'travel_start_date': start_date,
+                'travel_end_date': end_date,
                 'destination': post.get('destination'),
                 'reason': post.get('reason'),
                 'additional_notes': post.get('additional_notes'),
                 'patient_id': lot.assigned_patient_id.id,
-                'status': 'pending',
-            }
-            
-            request_record = request.env['insulin.holiday.pump.request'].sudo().create(vals)
-            
-            # Trigger email notification (Logic to be implemented in the model or here)
-            # For now, we just show the success page
-            return request.render("insulin_pumps_evercare.holiday_pump_request_success", {
-                'request_name': request_record.name
+                'ip_address': ip_address,
             })
+            request.env.ref('insulin_pumps_evercare.ir_cron_process_holiday_pump_submissions').sudo()._trigger()
+
+            return request.render("insulin_pumps_evercare.holiday_pump_request_success", {})
 
         return request.render("insulin_pumps_evercare.holiday_pump_request_template")
 
+
+class DeviceStatusController(http.Controller):
+
+    @http.route('/insulin_pumps/device_status_counts', type='json', auth='user')
+    def device_status_counts(self):
+        """Device counts for the dashboard header cards, read from the counters."""
+        return request.env['insulin.device.status.counter']._get_counts()
+
+
+class AssignmentUsageController(http.Controller):
+
+    @http.route('/insulin_pumps/assignment_usage/<int:wizard_id>/export', type='http', auth='user')
+    def export_assignment_usage(self, wizard_id):
+        """Stream the device usage query results as CSV.
+
+        The rows are spooled to a temporary file by PostgreSQL and sent in
+        chunks from there, keeping memory flat for large exports.
+        """
+        wizard = request.env['insulin.assignment.usage.wizard'].browse(wizard_id).exists()
+        if not wizard:
+            raise request.not_found()
+        spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        request.env['insulin.assignment.log']._export_usage_csv(spool, **wizard._get_usage_params())
+        size = spool.tell()
+        spool.seek(0)
+        return request.make_response(wrap_file(request.httprequest.environ, spool), headers=[
+            ('Content-Type', 'text/csv; charset=utf-8'),
+            ('Content-Length', str(size)),
+            ('Content-Disposition', content_disposition('device_usage.csv')),
+        ])
@@ -6,3 +6,17 @@ from . import consumables_allocation
 from . import holiday_pump_request
 from . import insulin_pumps_settings
 from . import replace_device_wizard
+from . import device_bulk_job
+from . import device_movement
+from . import patient_id_sequence
+from . import patient_import
+from . import patient_import_wizard
+from . import holiday_pump_submission
+from . import holiday_pump_reservation
+from . import device_status_counter
+from . import consumables_forecast
+from . import assignment_usage_wizard
+from . import fleet_utilization
+from . import replacement_demand
+from . import chatter_buffer
+from . import stock_move
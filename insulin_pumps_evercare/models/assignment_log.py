@@ -1,4 +1,18 @@
-from odoo import fields, models
+import logging
+
+from psycopg2.errors import UniqueViolation
+
+from odoo import api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists, create_index
+
+_logger = logging.getLogger(__name__)
+
+OPEN_LOG_INDEX = 'insulin_assignment_log_open_equipment_type_index'
+
+# Fields the fleet utilization snapshots are built from
+UTILIZATION_FIELDS = {'installation_date', 'replacement_date', 'assignment_type'}
 
 
 class AssignmentLog(models.Model):
@@ -35,15 +49,207 @@ class AssignmentLog(models.Model):
         help='Date when this device was replaced'
     )
     
-    # Computed fields for convenience
+    # Copies for sorting the list view; kept in sync with their sources by
+    # res.partner._propagate_patient_columns() and stock.lot._propagate_serial()
     patient_internal_id = fields.Char(
-        related='patient_id.patient_internal_id',
+        compute='_compute_patient_internal_id',
         string='Patient Internal ID',
         store=True
     )
     equipment_serial = fields.Char(
-        related='equipment_id.name',
+        compute='_compute_equipment_serial',
         string='Equipment SN',
-        store=True
+        store=True,
+        index=True
     )
 
+    def init(self):
+        super().init()
+        cr = self.env.cr
+        # Period the device was with the patient, open-ended while the log is
+        # open; the replacement day belongs to the next device. A log closed
+        # before its installation date gives an empty period instead of
+        # failing the write.
+        if not column_exists(cr, self._table, 'active_period'):
+            cr.execute(SQL(
+                """
+                ALTER TABLE %s
+                  ADD COLUMN active_period daterange
+                  GENERATED ALWAYS AS (
+                      daterange(
+                          installation_date,
+                          CASE WHEN replacement_date < installation_date THEN installation_date
+                               ELSE replacement_date END,
+                          '[)'
+                      )
+                  ) STORED
+                """,
+                SQL.identifier(self._table),
+            ))
+        create_index(
+            cr,
+            'insulin_assignment_log_active_period_index',
+            self._table,
+            ['active_period'],
+            method='gist',
+        )
+        # Open logs are looked up by patient when patients change devices
+        create_index(
+            self.env.cr,
+            'insulin_assignment_log_open_patient_index',
+            self._table,
+            ['patient_id', 'assignment_type'],
+            where='replacement_date IS NULL',
+        )
+        # A device has at most one open log per assignment type
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(SQL(
+                    """
+                    CREATE UNIQUE INDEX IF NOT EXISTS %s
+                        ON insulin_assignment_log (equipment_id, assignment_type)
+                     WHERE replacement_date IS NULL
+                    """,
+                    SQL.identifier(OPEN_LOG_INDEX),
+                ))
+        except UniqueViolation:
+            _logger.warning(
+                "Could not create %s: some devices have several open logs of the same type",
+                OPEN_LOG_INDEX,
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        try:
+            with self.env.cr.savepoint():
+                logs = super().create(vals_list)
+                self.flush_model()
+        except UniqueViolation:
+            raise ValidationError("This device already has an open assignment log of the same type.")
+        if logs:
+            self.env['insulin.fleet.utilization']._mark_changed(min(logs.mapped('installation_date')))
+        return logs
+
+    def write(self, vals):
+        if UTILIZATION_FIELDS & vals.keys():
+            self.env['insulin.fleet.utilization']._mark_changed(self._get_utilization_changed_from(vals))
+        if not {'replacement_date', 'equipment_id', 'assignment_type'} & vals.keys():
+            return super().write(vals)
+        try:
+            with self.env.cr.savepoint():
+                result = super().write(vals)
+                self.flush_model()
+        except UniqueViolation:
+            raise ValidationError("This device already has an open assignment log of the same type.")
+        return result
+
+    def unlink(self):
+        if self:
+            self.env['insulin.fleet.utilization']._mark_changed(min(self.mapped('installation_date')))
+        return super().unlink()
+
+    def _get_utilization_changed_from(self, vals):
+        """Earliest day whose fleet utilization changes when writing ``vals``.
+
+        Moving the start or type of a log changes every day since its old or
+        new installation date; closing or reopening it only changes the days
+        since its old or new replacement date.
+        """
+        if {'installation_date', 'assignment_type'} & vals.keys():
+            days = self.mapped('installation_date') + [fields.Date.to_date(vals.get('installation_date'))]
+        else:
+            days = self.mapped('replacement_date') + [fields.Date.to_date(vals.get('replacement_date'))]
+        return min(filter(None, days), default=fields.Date.today())
+
+    @api.model
+    def _usage_condition(self, date_from, date_to=None, serial_from=None, serial_to=None, product_ids=None):
+        """SQL condition on ``log`` and ``lot`` matching logs active in a period.
+
+        :param date_from: first day of the period
+        :param date_to: last day of the period, ``date_from`` for a single day
+        :param serial_from: lowest device serial number, inclusive
+        :param serial_to: highest device serial number, inclusive
+        :param product_ids: restrict to devices of these products
+        """
+        conditions = [SQL(
+            "log.active_period && daterange(%s, %s, '[]')", date_from, date_to or date_from,
+        )]
+        if serial_from:
+            conditions.append(SQL("log.equipment_serial >= %s", serial_from))
+        if serial_to:
+            conditions.append(SQL("log.equipment_serial <= %s", serial_to))
+        if product_ids:
+            conditions.append(SQL("lot.product_id IN %s", tuple(product_ids)))
+        return SQL(" AND ").join(conditions)
+
+    @api.model
+    def _find_usage(self, date_from, date_to=None, serial_from=None, serial_to=None, product_ids=None):
+        """Return the logs of devices with a patient on a day or during a period.
+
+        Answers "which patients had which pump" with one query over the GiST
+        index on the active period. See ``_usage_condition`` for the
+        parameters.
+        """
+        self.flush_model(['installation_date', 'replacement_date', 'equipment_serial', 'equipment_id'])
+        self.env['stock.lot'].flush_model(['product_id'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT log.id
+              FROM insulin_assignment_log log
+              JOIN stock_lot lot ON lot.id = log.equipment_id
+             WHERE %s
+          ORDER BY log.equipment_serial, log.installation_date
+            """,
+            self._usage_condition(date_from, date_to, serial_from, serial_to, product_ids),
+        ))
+        return self.browse(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _export_usage_csv(self, stream, date_from, date_to=None, serial_from=None, serial_to=None,
+                          product_ids=None):
+        """Write the matching logs as CSV to the binary file object ``stream``.
+
+        Rows are produced by PostgreSQL with ``COPY ... TO STDOUT`` and
+        written to ``stream`` as they arrive, so exports of any size never
+        go through the ORM or sit in memory.
+        """
+        self.flush_model(['installation_date', 'replacement_date', 'equipment_serial', 'equipment_id',
+                          'patient_id', 'patient_internal_id', 'assignment_type'])
+        self.env['stock.lot'].flush_model(['product_id'])
+        self.env['res.partner'].flush_model(['name'])
+        query = SQL(
+            """
+            COPY (
+                SELECT log.equipment_serial AS serial_number,
+                       COALESCE(pt.name->>%(lang)s, pt.name->>'en_US') AS product,
+                       log.patient_internal_id AS patient_internal_id,
+                       p.name AS patient_name,
+                       log.assignment_type AS assignment_type,
+                       log.installation_date AS installation_date,
+                       log.replacement_date AS replacement_date
+                  FROM insulin_assignment_log log
+                  JOIN stock_lot lot ON lot.id = log.equipment_id
+                  JOIN product_product pp ON pp.id = lot.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                  JOIN res_partner p ON p.id = log.patient_id
+                 WHERE %(condition)s
+              ORDER BY log.equipment_serial, log.installation_date
+            ) TO STDOUT WITH (FORMAT csv, HEADER)
+            """,
+            lang=self.env.lang or 'en_US',
+            condition=self._usage_condition(date_from, date_to, serial_from, serial_to, product_ids),
+        )
+        # COPY takes no bind parameters: render the query client-side first
+        cr = self.env.cr
+        cr.copy_expert(cr.mogrify(query.code, query.params).decode(), stream)
+
+    @api.depends('patient_id')
+    def _compute_patient_internal_id(self):
+        for log in self:
+            log.patient_internal_id = log.patient_id.patient_internal_id
+
+    @api.depends('equipment_id')
+    def _compute_equipment_serial(self):
+        for log in self:
+            log.equipment_serial = log.equipment_id.name
+
@@ -0,0 +1,64 @@
+from odoo import fields, models
+from odoo.exceptions import UserError
+
+
+class InsulinAssignmentUsageWizard(models.TransientModel):
+    """Find which patients had which devices on a day or during a period."""
+    _name = 'insulin.assignment.usage.wizard'
+    _description = 'Device Usage Query'
+
+    date_from = fields.Date(
+        string='From',
+        required=True,
+        default=fields.Date.context_today
+    )
+    date_to = fields.Date(
+        string='To',
+        help='Leave empty to query a single day'
+    )
+    serial_from = fields.Char(
+        string='Serial Number From',
+        help='Lowest serial number of the device range, inclusive'
+    )
+    serial_to = fields.Char(
+        string='Serial Number To',
+        help='Highest serial number of the device range, inclusive'
+    )
+    product_ids = fields.Many2many(
+        'product.product',
+        string='Products',
+        domain="[('is_insulin_pump_product', '=', True)]"
+    )
+
+    def _get_usage_params(self):
+        self.ensure_one()
+        if self.date_to and self.date_to < self.date_from:
+            raise UserError("The end date cannot be before the start date.")
+        return {
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'serial_from': (self.serial_from or '').strip() or None,
+            'serial_to': (self.serial_to or '').strip() or None,
+            'product_ids': self.product_ids.ids,
+        }
+
+    def action_search(self):
+        """Show the matching assignment logs."""
+        logs = self.env['insulin.assignment.log']._find_usage(**self._get_usage_params())
+        return {
+            'name': 'Device Usage',
+            'type': 'ir.actions.act_window',
+            'res_model': 'insulin.assignment.log',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', logs.ids)],
+            'context': {'create': False},
+        }
+
+    def action_export_csv(self):
+        """Download the matching assignment logs as a CSV file."""
+        self._get_usage_params()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/insulin_pumps/assignment_usage/{self.id}/export',
+            'target': 'self',
+        }
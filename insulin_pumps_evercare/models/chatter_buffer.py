@@ -0,0 +1,74 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+from markupsafe import Markup
+
+from odoo import api, models
+
+BUFFER_KEY = 'insulin_pumps.chatter_notes'
+
+
+class ChatterBuffer(models.AbstractModel):
+    """Transaction-scoped buffer of chatter notes.
+
+    Workflows queue their notes instead of posting them one by one. The
+    notes are flushed right before the transaction commits: all notes of a
+    record are joined into a single message, and the messages of each model
+    are created in one batch, without notifications or follower lookups.
+    The flush runs as superuser without context, and the messages are
+    authored by the user who queued the first note of the transaction.
+    """
+    _name = 'insulin.chatter.buffer'
+    _description = 'Insulin Pumps Chatter Buffer'
+
+    @api.model
+    def _add_note(self, record, note):
+        """Queue a plain-text note on a record inheriting ``mail.thread``."""
+        self._add_notes(record, {record.id: [note]})
+
+    @api.model
+    def _add_notes(self, records, notes_by_id):
+        """Queue plain-text notes on records inheriting ``mail.thread``.
+
+        :param records: any recordset of the model the notes belong to
+        :param notes_by_id: dict mapping record ids to lists of note strings
+        """
+        if not notes_by_id:
+            return
+        precommit = self.env.cr.precommit
+        if BUFFER_KEY not in precommit.data:
+            precommit.add(self.sudo().with_context({})._flush_notes)
+        buffer = precommit.data.setdefault(BUFFER_KEY, defaultdict(lambda: defaultdict(list)))
+        for res_id, notes in notes_by_id.items():
+            buffer[records._name][res_id].extend(notes)
+
+    @api.model
+    @contextmanager
+    def _savepoint(self):
+        """Open a savepoint whose rollback also drops the notes queued inside it."""
+        buffer = self.env.cr.precommit.data.get(BUFFER_KEY) or {}
+        snapshot = {
+            model_name: {res_id: list(notes) for res_id, notes in notes_by_id.items()}
+            for model_name, notes_by_id in buffer.items()
+        }
+        try:
+            with self.env.cr.savepoint():
+                yield
+        except Exception:
+            buffer = self.env.cr.precommit.data.get(BUFFER_KEY)
+            if buffer is not None:
+                buffer.clear()
+                for model_name, notes_by_id in snapshot.items():
+                    buffer[model_name].update(notes_by_id)
+            raise
+
+    @api.model
+    def _flush_notes(self):
+        """Log the queued notes, one message per record, one batch per model."""
+        buffer = self.env.cr.precommit.data.pop(BUFFER_KEY, None)
+        if not buffer:
+            return
+        for model_name, notes_by_id in buffer.items():
+            records = self.env[model_name].browse(list(notes_by_id)).exists()
+            bodies = {record.id: Markup('<br/>').join(notes_by_id[record.id]) for record in records}
+            records._message_log_batch(bodies)
@@ -1,4 +1,11 @@
+import logging
+import time
+
 from odoo import api, fields, models
+from odoo.osv import expression
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
 
 
 class ConsumablesAllocation(models.Model):
@@ -43,11 +50,11 @@ class ConsumablesAllocation(models.Model):
     @api.model
     def default_get(self, fields_list):
         res = super().default_get(fields_list)
-        get_param = self.env['ir.config_parameter'].sudo().get_param
+        settings = self.env['insulin.pumps.settings']._get_settings()
         if 'quantity_allocated' in fields_list:
-            res['quantity_allocated'] = int(get_param('insulin_pumps.default_allocated_quantity', 10))
+            res['quantity_allocated'] = settings['default_allocated_quantity']
         if 'threshold' in fields_list:
-            res['threshold'] = int(get_param('insulin_pumps.default_critical_threshold', 13))
+            res['threshold'] = settings['default_critical_threshold']
         return res
 
     quantity_allocated = fields.Integer(
@@ -55,7 +62,8 @@ class ConsumablesAllocation(models.Model):
     )
     quantity_used = fields.Integer(
         string='Quantity Used',
-        default=0
+        default=0,
+        help='Consumables delivered to the patient this month, updated from done stock moves'
     )
     threshold = fields.Integer(
         string='Threshold',
@@ -73,9 +81,10 @@ class ConsumablesAllocation(models.Model):
         store=True
     )
 
-    # Related fields
+    # Copy for sorting the list view; kept in sync with the patient by
+    # res.partner._propagate_patient_columns()
     patient_internal_id = fields.Char(
-        related='patient_id.patient_internal_id',
+        compute='_compute_patient_internal_id',
         string='Patient Internal ID',
         store=True
     )
@@ -88,9 +97,9 @@ class ConsumablesAllocation(models.Model):
         Warning (orange): quantity_allocated < quantity_used <= threshold
         Exceeded (red): quantity_used > threshold
         """
-        get_param = self.env['ir.config_parameter'].sudo().get_param
-        default_allocated = int(get_param('insulin_pumps.default_allocated_quantity', 10))
-        default_threshold = int(get_param('insulin_pumps.default_critical_threshold', 13))
+        settings = self.env['insulin.pumps.settings']._get_settings()
+        default_allocated = settings['default_allocated_quantity']
+        default_threshold = settings['default_critical_threshold']
         
         for record in self:
             allocated = record.quantity_allocated or default_allocated
@@ -103,6 +112,11 @@ class ConsumablesAllocation(models.Model):
             else:
                 record.threshold_status = 'red'
 
+    @api.depends('patient_id')
+    def _compute_patient_internal_id(self):
+        for record in self:
+            record.patient_internal_id = record.patient_id.patient_internal_id
+
     @api.depends('patient_id', 'month', 'year')
     def _compute_display_name(self):
         month_names = dict(self._fields['month'].selection)
@@ -119,6 +133,191 @@ class ConsumablesAllocation(models.Model):
             if record.threshold <= record.quantity_allocated:
                 raise models.ValidationError("The Critical Threshold must always be greater than the Allocated Quantity.")
 
+    @api.model
+    def _create_month_allocations(self, year, month):
+        """Create the allocation of the given month for every active patient.
+
+        Runs as a single INSERT ... SELECT relying on the
+        ``patient_month_year_unique`` constraint to skip patients that
+        already have an allocation. Quantities come from the default
+        settings or, when ``insulin_pumps.carry_over_allocations`` is set,
+        from the patient's allocation of the previous month; thresholds are
+        raised above the allocated quantity where needed. The stored
+        computed columns are filled in the same statement: a fresh
+        allocation has nothing used yet, so its status is always green.
+
+        :return: ids of the patients that received a new allocation
+        """
+        started = time.monotonic()
+        settings = self.env['insulin.pumps.settings']._get_settings()
+        default_allocated = settings['default_allocated_quantity']
+        default_threshold = settings['default_critical_threshold']
+        carry_over = settings['carry_over_allocations']
+        previous_year, previous_month = (year - 1, 12) if month == 1 else (year, month - 1)
+        month_name = dict(self._fields['month'].selection)[str(month)]
+        
+        if carry_over:
+            allocated = SQL("COALESCE(NULLIF(prev.quantity_allocated, 0), %s)", default_allocated)
+            threshold = SQL("COALESCE(NULLIF(prev.threshold, 0), %s)", default_threshold)
+        else:
+            allocated = SQL("%s", default_allocated)
+            threshold = SQL("%s", default_threshold)
+        # The insert bypasses _check_threshold_values: a carried-over value
+        # mixed with a default, or defaults saved out of order, must still
+        # give a positive threshold above the allocated quantity
+        quantities = SQL("%s, GREATEST(%s, %s + 1, 1)", allocated, threshold, allocated)
+        
+        self.env['res.partner'].flush_model(['is_patient', 'active', 'name', 'patient_internal_id'])
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO insulin_consumables_allocation (
+                patient_id, month, year, quantity_allocated, threshold, quantity_used,
+                threshold_status, display_name, patient_internal_id,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT p.id, %(month)s, %(year)s, %(quantities)s, 0,
+                   'green', CONCAT(COALESCE(p.name, 'Unknown'), ' - ', %(month_name)s, ' ', %(year)s), p.patient_internal_id,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM res_partner p
+         LEFT JOIN insulin_consumables_allocation prev
+                ON prev.patient_id = p.id AND prev.month = %(previous_month)s AND prev.year = %(previous_year)s
+             WHERE p.is_patient AND p.active
+            ON CONFLICT (patient_id, month, year) DO NOTHING
+            RETURNING patient_id
+            """,
+            month=str(month),
+            year=year,
+            quantities=quantities,
+            month_name=month_name,
+            uid=self.env.uid,
+            previous_month=str(previous_month),
+            previous_year=previous_year,
+        ))
+        patient_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model()
+        self.env['res.partner'].invalidate_model(['consumables_allocation_ids'])
+        _logger.info(
+            "Consumables rollover %s/%s: %d allocations created in %.2fs",
+            month, year, len(patient_ids), time.monotonic() - started,
+        )
+        return patient_ids
+
+    @api.model
+    def _recompute_default_based_status(self, fnames):
+        """Recompute the threshold status of allocations relying on defaults.
+
+        Only allocations without their own value for one of ``fnames``
+        (``quantity_allocated`` or ``threshold``) use the default settings,
+        so only those are marked for recomputation, along with the patient
+        columns depending on them.
+
+        :return: the allocations recomputed
+        """
+        domain = expression.OR([[(fname, 'in', [0, False])] for fname in fnames])
+        allocations = self.search(domain)
+        if allocations:
+            allocations.modified(fnames)
+            self.env.flush_all()
+        _logger.info("Threshold status recomputed for %d allocations using defaults", len(allocations))
+        return allocations
+
+    @api.model
+    def _apply_consumable_deliveries(self):
+        """Add newly done consumable deliveries to the patients' allocations.
+
+        Done consumable moves to or from a patient that were not applied yet
+        are marked as applied and aggregated per (patient, month, year) in
+        the same statement, in product units of measure. Deliveries to a
+        patient add to ``quantity_used`` and returns from a patient subtract
+        from it. A move is marked in the transaction applying it, so it is
+        counted exactly once, however late its own transaction committed.
+        Two runs marking the same move conflict: the later one fails with a
+        serialization error and rolls back, and its next run skips the move.
+
+        :return: the allocations that were updated or created
+        """
+        self.env['stock.move'].flush_model([
+            'state', 'date', 'product_id', 'product_qty', 'location_id', 'location_dest_id',
+            'partner_id', 'picking_id', 'insulin_usage_applied',
+        ])
+        self.env['stock.picking'].flush_model(['partner_id'])
+        self.env.cr.execute(SQL(
+            """
+            WITH applied AS (
+                UPDATE stock_move m
+                   SET insulin_usage_applied = TRUE
+                  FROM product_product pp, product_template pt,
+                       stock_location src, stock_location dest, res_partner patient
+                 WHERE m.state = 'done'
+                   AND m.insulin_usage_applied IS NOT TRUE
+                   AND pp.id = m.product_id
+                   AND pt.id = pp.product_tmpl_id
+                   AND pt.is_insulin_consumable_product
+                   AND src.id = m.location_id
+                   AND dest.id = m.location_dest_id
+                   AND (src.usage = 'customer') != (dest.usage = 'customer')
+                   AND patient.id = COALESCE(
+                           m.partner_id,
+                           (SELECT picking.partner_id FROM stock_picking picking WHERE picking.id = m.picking_id)
+                       )
+                   AND patient.is_patient
+             RETURNING patient.id AS patient_id, m.date, m.product_qty, dest.usage = 'customer' AS delivered
+            )
+            SELECT patient_id,
+                   EXTRACT(YEAR FROM date)::integer,
+                   EXTRACT(MONTH FROM date)::integer,
+                   SUM(CASE WHEN delivered THEN product_qty ELSE -product_qty END)
+              FROM applied
+          GROUP BY 1, 2, 3
+            """
+        ))
+        usage = {
+            (patient_id, str(month), year): round(quantity)
+            for patient_id, year, month, quantity in self.env.cr.fetchall()
+            if quantity
+        }
+        self.env['stock.move'].invalidate_model(['insulin_usage_applied'])
+        if not usage:
+            return self.browse()
+
+        # Add the usage to the existing allocations in one UPDATE
+        self.flush_model(['patient_id', 'month', 'year', 'quantity_used'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE insulin_consumables_allocation a
+               SET quantity_used = COALESCE(a.quantity_used, 0) + u.quantity,
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (VALUES %(values)s) AS u(patient_id, month, year, quantity)
+             WHERE a.patient_id = u.patient_id AND a.month = u.month AND a.year = u.year
+         RETURNING a.id, a.patient_id, a.month, a.year
+            """,
+            uid=self.env.uid,
+            values=SQL(", ").join(
+                SQL("(%s, %s, %s, %s)", patient_id, month, year, quantity)
+                for (patient_id, month, year), quantity in usage.items()
+            ),
+        ))
+        rows = self.env.cr.fetchall()
+        allocations = self.browse([row[0] for row in rows])
+        self.invalidate_model(['quantity_used', 'write_uid', 'write_date'])
+        allocations.modified(['quantity_used'])
+
+        updated_keys = {(patient_id, month, year) for _id, patient_id, month, year in rows}
+        allocations |= self.create([
+            {'patient_id': patient_id, 'month': month, 'year': year, 'quantity_used': quantity}
+            for (patient_id, month, year), quantity in usage.items()
+            if (patient_id, month, year) not in updated_keys
+        ])
+        _logger.info("Consumables usage: %d allocations updated", len(allocations))
+        return allocations
+
+    @api.model
+    def _cron_apply_consumable_deliveries(self):
+        """Scheduled action feeding consumable deliveries into allocations."""
+        self._apply_consumable_deliveries()
+
     @api.onchange('quantity_allocated')
     def _onchange_quantity_allocated(self):
         """Show warning if more than threshold consumables allocated."""
@@ -0,0 +1,229 @@
+import logging
+
+import numpy as np
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Months of usage history loaded for the forecast
+HISTORY_MONTHS = 6
+# Months averaged for the rolling usage
+ROLLING_MONTHS = 3
+
+
+class ConsumablesForecast(models.Model):
+    """Next month consumables usage forecast per patient.
+
+    The whole usage history is loaded in one query into a patients x months
+    matrix, and rolling averages and linear trends are computed for every
+    patient at once with NumPy. The results replace the table contents on
+    each refresh.
+    """
+    _name = 'insulin.consumables.forecast'
+    _description = 'Insulin Pump Consumables Forecast'
+    _rec_name = 'patient_id'
+    _order = 'forecast_ratio desc, patient_id'
+
+    _sql_constraints = [
+        ('patient_unique', 'unique(patient_id)',
+         'A forecast already exists for this patient.')
+    ]
+
+    patient_id = fields.Many2one(
+        'res.partner',
+        string='Patient',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    patient_internal_id = fields.Char(
+        related='patient_id.patient_internal_id',
+        string='Patient Internal ID'
+    )
+    forecast_month = fields.Selection(
+        selection=lambda self: self.env['insulin.consumables.allocation']._fields['month'].selection,
+        string='Forecast Month',
+        readonly=True
+    )
+    forecast_year = fields.Integer(
+        string='Forecast Year',
+        readonly=True
+    )
+    history_months = fields.Integer(
+        string='Months of History',
+        readonly=True,
+        help='Number of months with recorded usage in the forecast window'
+    )
+    last_quantity_used = fields.Integer(
+        string='Last Month Usage',
+        readonly=True
+    )
+    rolling_average = fields.Float(
+        string='Rolling Average',
+        digits=(16, 1),
+        readonly=True,
+        help=f'Average usage over the last {ROLLING_MONTHS} months with recorded usage'
+    )
+    trend = fields.Float(
+        string='Trend per Month',
+        digits=(16, 2),
+        readonly=True,
+        help='Slope of the linear fit of the usage history'
+    )
+    forecast_quantity = fields.Float(
+        string='Forecast Usage',
+        digits=(16, 1),
+        readonly=True
+    )
+    threshold = fields.Integer(
+        string='Threshold',
+        readonly=True
+    )
+    forecast_ratio = fields.Float(
+        string='Forecast / Threshold',
+        digits=(16, 2),
+        readonly=True
+    )
+    current_threshold_status = fields.Selection(
+        related='patient_id.current_threshold_status',
+        string='Current Status'
+    )
+    likely_to_exceed = fields.Boolean(
+        string='Likely to Exceed',
+        readonly=True,
+        index=True,
+        help='The forecast usage for next month is above the threshold'
+    )
+    computed_at = fields.Datetime(
+        string='Computed At',
+        readonly=True
+    )
+
+    @api.model
+    def _load_usage_matrix(self, first_month_index, months):
+        """Load the usage history of every patient in one query.
+
+        Months are addressed by ``year * 12 + month - 1``.
+
+        :return: tuple ``(patient_ids, usage, thresholds)`` where ``usage``
+            is a patients x months float array with NaN for missing months
+            and ``thresholds`` holds each patient's latest threshold
+        """
+        Allocation = self.env['insulin.consumables.allocation']
+        Allocation.flush_model(['patient_id', 'month', 'year', 'quantity_used', 'threshold'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT patient_id, year * 12 + month::integer - 1, quantity_used, threshold
+              FROM insulin_consumables_allocation
+             WHERE year * 12 + month::integer - 1 BETWEEN %s AND %s
+          ORDER BY patient_id, 2
+            """,
+            first_month_index, first_month_index + months - 1,
+        ))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, months)), np.empty(0)
+
+        data = np.array(
+            [(patient_id, month_index, used or 0, threshold or 0)
+             for patient_id, month_index, used, threshold in rows],
+            dtype=np.int64,
+        )
+        patient_ids, rows_patient = np.unique(data[:, 0], return_inverse=True)
+        usage = np.full((len(patient_ids), months), np.nan)
+        usage[rows_patient, data[:, 1] - first_month_index] = data[:, 2]
+        # Rows are sorted by month: the first row of each patient in the
+        # reversed rows is its latest one
+        _patient_ids, latest_from_end = np.unique(data[::-1, 0], return_index=True)
+        thresholds = data[len(data) - 1 - latest_from_end, 3].astype(float)
+        return patient_ids, usage, thresholds
+
+    @api.model
+    def _compute_forecasts(self, usage, months_ahead=1):
+        """Forecast the usage for every row of ``usage`` at once.
+
+        :param usage: patients x months array, NaN for missing months
+        :param months_ahead: months between the last month of ``usage`` and
+            the forecast month
+        :return: tuple ``(history, rolling, trend, forecast)`` arrays
+        """
+        months = usage.shape[1]
+        known = ~np.isnan(usage)
+        values = np.where(known, usage, 0.0)
+        history = known.sum(axis=1)
+
+        # Rolling average over the latest known months
+        latest_rank = np.cumsum(known[:, ::-1], axis=1)[:, ::-1]
+        in_window = known & (latest_rank <= ROLLING_MONTHS)
+        window_count = in_window.sum(axis=1)
+        rolling = np.divide(
+            (values * in_window).sum(axis=1), window_count,
+            out=np.zeros(len(usage)), where=window_count > 0,
+        )
+
+        # Least squares slope over the known months
+        x = np.arange(months, dtype=float)
+        x_mean = np.divide((x * known).sum(axis=1), history, out=np.zeros(len(usage)), where=history > 0)
+        y_mean = np.divide(values.sum(axis=1), history, out=np.zeros(len(usage)), where=history > 0)
+        dx = (x - x_mean[:, None]) * known
+        variance = (dx ** 2).sum(axis=1)
+        trend = np.divide(
+            (dx * (values - y_mean[:, None])).sum(axis=1), variance,
+            out=np.zeros(len(usage)), where=variance > 0,
+        )
+
+        # Project the rolling average to the forecast month along the trend
+        x_window = np.divide((x * in_window).sum(axis=1), window_count, out=np.zeros(len(usage)),
+                             where=window_count > 0)
+        forecast = np.maximum(rolling + trend * (months - 1 + months_ahead - x_window), 0.0)
+        return history, rolling, trend, forecast
+
+    @api.model
+    def _refresh_forecasts(self, today=None):
+        """Recompute the forecast of every patient for next month.
+
+        :return: number of forecasts written
+        """
+        today = today or fields.Date.context_today(self)
+        current_month_index = today.year * 12 + today.month - 1
+        # The current month is still running: its usage is incomplete and
+        # would drag the averages and trends down
+        first_month_index = current_month_index - HISTORY_MONTHS
+        next_year, next_month = divmod(current_month_index + 1, 12)
+
+        patient_ids, usage, thresholds = self._load_usage_matrix(first_month_index, HISTORY_MONTHS)
+        history, rolling, trend, forecast = self._compute_forecasts(usage, months_ahead=2)
+
+        default_threshold = self.env['insulin.pumps.settings']._get('default_critical_threshold')
+        thresholds = np.where(thresholds > 0, thresholds, default_threshold)
+        ratio = forecast / thresholds
+        last_used = np.nan_to_num(usage[:, -1]).astype(int)
+
+        self.env.cr.execute(SQL("DELETE FROM insulin_consumables_forecast"))
+        self.invalidate_model()
+        self.create([{
+            'patient_id': int(patient_ids[i]),
+            'forecast_month': str(next_month + 1),
+            'forecast_year': next_year,
+            'history_months': int(history[i]),
+            'last_quantity_used': int(last_used[i]),
+            'rolling_average': float(rolling[i]),
+            'trend': float(trend[i]),
+            'forecast_quantity': float(forecast[i]),
+            'threshold': int(thresholds[i]),
+            'forecast_ratio': float(ratio[i]),
+            'likely_to_exceed': bool(ratio[i] > 1),
+            'computed_at': fields.Datetime.now(),
+        } for i in range(len(patient_ids))])
+        _logger.info(
+            "Consumables forecast refreshed: %d patients, %d likely to exceed their threshold",
+            len(patient_ids), int((ratio > 1).sum()),
+        )
+        return len(patient_ids)
+
+    @api.model
+    def _cron_refresh_forecasts(self):
+        """Scheduled action recomputing the consumables forecasts nightly."""
+        self._refresh_forecasts()
@@ -0,0 +1,129 @@
+import logging
+import threading
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class DeviceBulkJob(models.Model):
+    """Background job for unassigning or scrapping large device selections."""
+    _name = 'insulin.device.bulk.job'
+    _description = 'Insulin Pump Bulk Device Job'
+    _order = 'create_date desc'
+
+    name = fields.Char(
+        string='Job',
+        compute='_compute_name',
+        store=True
+    )
+    action = fields.Selection([
+        ('unassign', 'Unassign Devices'),
+        ('scrap', 'Scrap Devices'),
+    ], string='Action', required=True, readonly=True)
+    lot_ids = fields.Many2many(
+        'stock.lot',
+        string='Devices',
+        readonly=True
+    )
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='State', default='pending', readonly=True)
+    total_count = fields.Integer(
+        string='Devices',
+        readonly=True
+    )
+    processed_count = fields.Integer(
+        string='Processed',
+        readonly=True
+    )
+    progress = fields.Float(
+        string='Progress',
+        compute='_compute_progress'
+    )
+    error_message = fields.Text(
+        string='Error',
+        readonly=True
+    )
+
+    @api.depends('action', 'total_count')
+    def _compute_name(self):
+        actions = dict(self._fields['action'].selection)
+        for job in self:
+            job.name = f"{actions.get(job.action, '')} ({job.total_count})"
+
+    @api.depends('processed_count', 'total_count')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = 100.0 * job.processed_count / job.total_count if job.total_count else 0.0
+
+    @api.model
+    def _enqueue(self, action, lots):
+        """Queue a bulk action on the given devices and wake up the worker cron."""
+        job = self.create({
+            'action': action,
+            'lot_ids': [(6, 0, lots.ids)],
+            'total_count': len(lots),
+        })
+        cron = self.env.ref('insulin_pumps_evercare.ir_cron_process_device_bulk_jobs', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Bulk Action Queued',
+                'message': f"{job.name} will be processed in the background.",
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    def _get_remaining_lots(self):
+        """Devices of this job that still need processing."""
+        self.ensure_one()
+        if self.action == 'unassign':
+            return self.lot_ids.filtered(lambda lot: lot.pump_state == 'assigned' and lot.assigned_patient_id)
+        return self.lot_ids.filtered(lambda lot: lot.pump_state != 'scrapped')
+
+    def _process(self, batch_size, auto_commit):
+        """Process the job in batches, committing progress after each batch.
+
+        Remaining devices are derived from their current state, so a job
+        interrupted part-way resumes where it stopped on the next run.
+        """
+        self.ensure_one()
+        remaining = self._get_remaining_lots()
+        self.write({
+            'state': 'running',
+            'processed_count': self.total_count - len(remaining),
+        })
+        for offset in range(0, len(remaining), batch_size):
+            batch = remaining[offset:offset + batch_size]
+            try:
+                with self.env['insulin.chatter.buffer']._savepoint():
+                    if self.action == 'unassign':
+                        batch._bulk_unassign_devices()
+                    else:
+                        batch._bulk_scrap_devices()
+            except Exception as e:
+                _logger.exception("Bulk device job %s failed", self.id)
+                self.write({'state': 'failed', 'error_message': str(e)})
+                if auto_commit:
+                    self.env.cr.commit()
+                return
+            self.processed_count += len(batch)
+            if auto_commit:
+                self.env.cr.commit()
+        self.state = 'done'
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Scheduled action processing queued bulk device jobs."""
+        batch_size = self.env['insulin.pumps.settings']._get('cron_batch_size') or 1000
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            job._process(batch_size, auto_commit)
@@ -0,0 +1,111 @@
+from collections import defaultdict
+
+from odoo import Command, api, models
+
+
+class DeviceMovement(models.AbstractModel):
+    """Move sets of insulin pump devices between stock locations."""
+    _name = 'insulin.device.movement'
+    _description = 'Insulin Pump Device Movement'
+
+    @api.model
+    def _get_return_location(self):
+        """Return location configured in settings, if any."""
+        return_location_id = self.env['insulin.pumps.settings']._get('return_location_id')
+        return self.env['stock.location'].browse(return_location_id).exists()
+
+    @api.model
+    def _get_scrap_location(self):
+        """Location scrapped devices are moved to."""
+        return self.env.ref('insulin_pumps_evercare.stock_location_scrapped', raise_if_not_found=False)
+
+    @api.model
+    def _move_to_return_location(self, lots):
+        """Transfer devices to the configured return location, if any."""
+        return self._move_devices(lots, self._get_return_location(), origin='Device Return')
+
+    @api.model
+    def _move_to_scrap_location(self, lots):
+        """Transfer devices to the scrap location."""
+        return self._move_devices(lots, self._get_scrap_location(), origin='Device Scrap')
+
+    @api.model
+    def _move_devices(self, lots, destination, origin=False):
+        """Move devices to a destination location in as few pickings as possible.
+
+        The current location of every device is read from stock.quant in one
+        query. Devices are grouped per source location, and each group is
+        moved with a single picking holding one move per product and one
+        move line per lot, validated in a single ``_action_done`` pass.
+        Devices without stock or already at the destination are skipped.
+
+        :param lots: ``stock.lot`` records to move
+        :param destination: ``stock.location`` to move them to
+        :param origin: source document label set on the pickings
+        :return: the validated ``stock.picking`` records
+        """
+        Picking = self.env['stock.picking']
+        if not lots or not destination:
+            return Picking
+
+        # Find current location of the devices via stock.quant
+        quants = self.env['stock.quant'].search([
+            ('lot_id', 'in', lots.ids),
+            ('quantity', '>', 0),
+            ('location_id.usage', '=', 'internal'),
+        ])
+        lots_by_location = defaultdict(lambda: self.env['stock.lot'])
+        for quant in quants:
+            if quant.location_id != destination and quant.lot_id not in lots_by_location[quant.location_id]:
+                lots_by_location[quant.location_id] |= quant.lot_id
+
+        pickings = Picking
+        for source, source_lots in lots_by_location.items():
+            pickings |= self._create_device_picking(source_lots, source, destination, origin)
+
+        moves = pickings.move_ids
+        if moves:
+            moves.picked = True
+            moves._action_done()
+        return pickings
+
+    @api.model
+    def _create_device_picking(self, lots, source, destination, origin):
+        """Create a confirmed internal picking with one move line per lot."""
+        picking_type = self.env['stock.picking.type'].search([
+            ('code', '=', 'internal'),
+            ('company_id', 'in', (source.company_id.id, False)),
+        ], limit=1)
+
+        lots_by_product = defaultdict(lambda: self.env['stock.lot'])
+        for lot in lots:
+            lots_by_product[lot.product_id] |= lot
+
+        picking = self.env['stock.picking'].create({
+            'picking_type_id': picking_type.id,
+            'location_id': source.id,
+            'location_dest_id': destination.id,
+            'origin': origin,
+            'move_ids': [Command.create({
+                'name': f'{origin or "Device Move"}: {product.display_name}',
+                'product_id': product.id,
+                'product_uom_qty': len(product_lots),
+                'product_uom': product.uom_id.id,
+                'location_id': source.id,
+                'location_dest_id': destination.id,
+            }) for product, product_lots in lots_by_product.items()],
+        })
+        picking.move_ids._action_confirm()
+
+        # Assign each lot explicitly instead of reserving through _action_assign
+        self.env['stock.move.line'].create([{
+            'move_id': move.id,
+            'picking_id': picking.id,
+            'product_id': move.product_id.id,
+            'product_uom_id': move.product_uom.id,
+            'lot_id': lot.id,
+            'quantity': 1,
+            'location_id': source.id,
+            'location_dest_id': destination.id,
+        } for move in picking.move_ids for lot in lots_by_product[move.product_id]])
+        return picking
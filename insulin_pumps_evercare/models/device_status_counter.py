@@ -0,0 +1,125 @@
+import logging
+from collections import Counter
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+
+class DeviceStatusCounter(models.Model):
+    """Materialized insulin pump counts per product, RMA flag and state.
+
+    Rows are kept up to date by deltas applied from ``stock.lot`` create,
+    write and unlink, and rebuilt from scratch by a nightly reconcile job,
+    so the dashboard reads a handful of rows instead of aggregating every
+    lot on each refresh.
+    """
+    _name = 'insulin.device.status.counter'
+    _description = 'Insulin Pump Status Counter'
+    _order = 'product_id, is_rma_device, pump_state'
+
+    _sql_constraints = [
+        ('product_rma_state_unique', 'unique(product_id, is_rma_device, pump_state)',
+         'A counter already exists for this product, RMA flag and state.')
+    ]
+
+    product_id = fields.Many2one(
+        'product.product',
+        string='Product',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    is_rma_device = fields.Boolean(
+        string='RMA Devices',
+        readonly=True
+    )
+    pump_state = fields.Selection([
+        ('available', 'Available'),
+        ('assigned', 'Assigned'),
+        ('scrapped', 'Scrapped'),
+    ], string='Pump State', required=True, readonly=True)
+    device_count = fields.Integer(
+        string='Devices',
+        readonly=True
+    )
+
+    @api.model
+    def _get_lot_keys(self, lots):
+        """Counter keys of the insulin pumps among ``lots``."""
+        return Counter(
+            (lot.product_id.id, bool(lot.is_rma_device), lot.pump_state or 'available')
+            for lot in lots if lot.is_insulin_pump
+        )
+
+    @api.model
+    def _apply_deltas(self, before, after):
+        """Apply the difference between two key counters in one upsert."""
+        deltas = Counter(after)
+        deltas.subtract(before)
+        rows = [(key, delta) for key, delta in deltas.items() if delta]
+        if not rows:
+            return
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO insulin_device_status_counter (product_id, is_rma_device, pump_state, device_count)
+            VALUES %s
+            ON CONFLICT (product_id, is_rma_device, pump_state)
+            DO UPDATE SET device_count = insulin_device_status_counter.device_count + EXCLUDED.device_count
+            """,
+            SQL(", ").join(
+                SQL("(%s, %s, %s, %s)", product_id, is_rma_device, pump_state, delta)
+                for (product_id, is_rma_device, pump_state), delta in rows
+            ),
+        ))
+        self.invalidate_model(['device_count'])
+
+    @api.model
+    def _reconcile(self):
+        """Rebuild every counter from the current lots."""
+        self.env['stock.lot'].flush_model(['product_id', 'is_insulin_pump', 'is_rma_device', 'pump_state'])
+        self.env.cr.execute(SQL("DELETE FROM insulin_device_status_counter"))
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO insulin_device_status_counter (product_id, is_rma_device, pump_state, device_count)
+            SELECT product_id, COALESCE(is_rma_device, FALSE), COALESCE(pump_state, 'available'), COUNT(*)
+              FROM stock_lot
+             WHERE is_insulin_pump
+          GROUP BY 1, 2, 3
+            """
+        ))
+        self.invalidate_model()
+        _logger.info("Device status counters reconciled: %d rows", self.env.cr.rowcount)
+
+    @api.model
+    def _cron_reconcile(self):
+        """Scheduled action correcting any drift in the counters."""
+        self._reconcile()
+
+    @api.model
+    def _get_counts(self):
+        """Return device counts for the dashboard header cards.
+
+        :return: dict with the totals per state and a ``breakdown`` list per
+            product and RMA flag
+        """
+        totals = {'available': 0, 'assigned': 0, 'scrapped': 0}
+        breakdown = {}
+        for counter in self.search_fetch([], ['product_id', 'is_rma_device', 'pump_state', 'device_count']):
+            totals[counter.pump_state] += counter.device_count
+            row = breakdown.setdefault((counter.product_id.id, counter.is_rma_device), {
+                'product_id': counter.product_id.id,
+                'product_name': counter.product_id.display_name,
+                'is_rma_device': counter.is_rma_device,
+                'available': 0,
+                'assigned': 0,
+                'scrapped': 0,
+            })
+            row[counter.pump_state] += counter.device_count
+        return {
+            'assigned': totals['assigned'],
+            'unassigned': totals['available'],
+            'scrapped': totals['scrapped'],
+            'breakdown': list(breakdown.values()),
+        }
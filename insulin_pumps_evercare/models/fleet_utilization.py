@@ -0,0 +1,291 @@
+import logging
+from collections import Counter
+from datetime import date, timedelta
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+CHANGE_TABLE = 'insulin_fleet_utilization_change'
+
+
+class FleetUtilization(models.Model):
+    """Daily snapshot of the insulin pump fleet utilization.
+
+    One row per day with the number of devices in the fleet, assigned to
+    patients and on holiday loan. Rows are built by sweeping the start and
+    end events of every assignment log and device, sorted by date, and are
+    extended each night from the last snapshot instead of being rebuilt:
+    the sweep carries on from the totals of the day before the refresh,
+    loading only the events of the refreshed days.
+    """
+    _name = 'insulin.fleet.utilization'
+    _description = 'Insulin Pump Fleet Utilization'
+    _rec_name = 'date'
+    _order = 'date desc'
+
+    _sql_constraints = [
+        ('date_unique', 'unique(date)',
+         'A utilization snapshot already exists for this day.')
+    ]
+
+    date = fields.Date(
+        string='Date',
+        required=True,
+        readonly=True,
+        index=True
+    )
+    # Daily counts are averaged when grouped by week, month or year
+    fleet_count = fields.Integer(
+        string='Fleet',
+        readonly=True,
+        aggregator='avg',
+        help='Insulin pumps in service on this day'
+    )
+    assigned_count = fields.Integer(
+        string='Assigned',
+        readonly=True,
+        aggregator='avg',
+        help='Devices assigned to patients as their primary device'
+    )
+    holiday_loan_count = fields.Integer(
+        string='On Holiday Loan',
+        readonly=True,
+        aggregator='avg'
+    )
+    available_count = fields.Integer(
+        string='Available',
+        readonly=True,
+        aggregator='avg',
+        help='Devices in service neither assigned nor on holiday loan'
+    )
+    holiday_fleet_count = fields.Integer(
+        string='Holiday Fleet',
+        readonly=True,
+        aggregator='avg',
+        help='Holiday pumps in service on this day'
+    )
+    holiday_available_count = fields.Integer(
+        string='Holiday Pumps Available',
+        readonly=True,
+        aggregator='avg'
+    )
+    computed_at = fields.Datetime(
+        string='Computed At',
+        readonly=True
+    )
+
+    def init(self):
+        super().init()
+        # Earliest days touched by assignment log changes since the last
+        # refresh; append-only so concurrent workflows never wait on it
+        self.env.cr.execute(SQL(
+            "CREATE TABLE IF NOT EXISTS %s (day date NOT NULL)",
+            SQL.identifier(CHANGE_TABLE),
+        ))
+
+    @api.model
+    def _mark_changed(self, day):
+        """Record that the snapshots from ``day`` on are out of date."""
+        self.env.cr.execute(SQL(
+            "INSERT INTO %s (day) VALUES (%s)",
+            SQL.identifier(CHANGE_TABLE), day,
+        ))
+
+    @api.model
+    def _get_refresh_start(self):
+        """First day whose snapshot must be (re)computed.
+
+        The last snapshot is always recomputed, as it may have been taken
+        before the end of its day, along with every day from the earliest
+        day recorded by assignment log changes since the last refresh.
+        Those records are consumed, and restored if the refresh rolls back.
+        """
+        self.flush_model(['date'])
+        self.env['insulin.assignment.log'].flush_model()
+        self.env.cr.execute(SQL("SELECT MAX(date) FROM insulin_fleet_utilization"))
+        last_date = self.env.cr.fetchone()[0]
+        self.env.cr.execute(SQL(
+            """
+            WITH changes AS (
+                DELETE FROM %s RETURNING day
+            )
+            SELECT MIN(day) FROM changes
+            """,
+            SQL.identifier(CHANGE_TABLE),
+        ))
+        changed_from = self.env.cr.fetchone()[0]
+        return min(filter(None, [last_date, changed_from]), default=None)
+
+    @api.model
+    def _get_start_totals(self, date_from):
+        """Running totals at the start of ``date_from``, from the snapshot of
+        the day before, or None when there is no such snapshot.
+
+        Days before the refresh start are unaffected by the changes being
+        refreshed, so that snapshot is still accurate.
+        """
+        snapshot = self.search_fetch(
+            [('date', '=', date_from - timedelta(days=1))],
+            ['fleet_count', 'assigned_count', 'holiday_loan_count', 'holiday_fleet_count'],
+            limit=1,
+        )
+        if not snapshot:
+            return None
+        return Counter({
+            'primary_fleet': snapshot.fleet_count - snapshot.holiday_fleet_count,
+            'holiday_fleet': snapshot.holiday_fleet_count,
+            'primary': snapshot.assigned_count,
+            'holiday_pump': snapshot.holiday_loan_count,
+        })
+
+    @api.model
+    def _load_events(self, date_from, date_to, events_from=None):
+        """Load the utilization events up to ``date_to``, sorted by day.
+
+        Assignment logs start on their installation date and end on their
+        replacement date. Devices join the fleet when first created or
+        installed, and leave it when moved to the scrap location. Events
+        before ``date_from`` are summed into ``date_from`` so the sweep
+        starts from the right totals.
+
+        :param events_from: only load the events from this day on, when the
+            totals before it are already known
+        :return: list of ``(day, kind, delta)`` sorted by day, where kind is
+            an assignment type or ``primary_fleet`` / ``holiday_fleet``
+        """
+        events_from = events_from or date.min
+        # Periods exclude their replacement day: a log replaced on
+        # events_from only overlaps from the day before
+        overlap_from = events_from - timedelta(days=1) if events_from > date.min else events_from
+        scrap_location = self.env['insulin.device.movement']._get_scrap_location()
+        self.env['stock.lot'].flush_model(['is_insulin_pump', 'pump_state', 'pump_type', 'first_assignment_date'])
+        self.env['insulin.assignment.log'].flush_model(['assignment_type', 'installation_date', 'replacement_date'])
+        self.env['stock.move.line'].flush_model(['lot_id', 'location_dest_id', 'state', 'date'])
+        self.env.cr.execute(SQL(
+            """
+            WITH logs AS (
+                -- Logs with a start or end from events_from on, through the
+                -- active period index; empty periods add nothing
+                SELECT installation_date, replacement_date, assignment_type
+                  FROM insulin_assignment_log
+                 WHERE active_period && daterange(%(overlap_from)s, NULL)
+            ), devices AS (
+                SELECT lot.id,
+                       CASE WHEN lot.pump_type = 'holiday' THEN 'holiday_fleet' ELSE 'primary_fleet' END AS kind,
+                       LEAST(lot.create_date::date, lot.first_assignment_date) AS in_service,
+                       CASE WHEN lot.pump_state = 'scrapped' THEN COALESCE(
+                           (SELECT MAX(ml.date)::date
+                              FROM stock_move_line ml
+                             WHERE ml.lot_id = lot.id AND ml.location_dest_id = %(scrap_location)s AND ml.state = 'done'),
+                           lot.write_date::date
+                       ) END AS out_of_service
+                  FROM stock_lot lot
+                 WHERE lot.is_insulin_pump
+                   -- Scrapping writes the lot, so older lots cannot have
+                   -- an event from events_from on
+                   AND (lot.create_date >= %(events_from)s OR lot.write_date >= %(events_from)s)
+            ), events AS (
+                SELECT installation_date AS day, assignment_type AS kind, 1 AS delta
+                  FROM logs
+             UNION ALL
+                SELECT replacement_date, assignment_type, -1
+                  FROM logs
+                 WHERE replacement_date IS NOT NULL
+             UNION ALL
+                SELECT in_service, kind, 1
+                  FROM devices
+             UNION ALL
+                SELECT out_of_service, kind, -1
+                  FROM devices
+                 WHERE out_of_service IS NOT NULL
+            )
+            SELECT GREATEST(day, %(date_from)s), kind, SUM(delta)::integer
+              FROM events
+             WHERE day BETWEEN %(events_from)s AND %(date_to)s
+          GROUP BY 1, 2
+          ORDER BY 1
+            """,
+            scrap_location=scrap_location.id or 0,
+            date_from=date_from,
+            date_to=date_to,
+            events_from=events_from,
+            overlap_from=overlap_from,
+        ))
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _sweep(self, events, date_from, date_to, totals=None):
+        """Sweep the sorted events into one snapshot per day.
+
+        :param totals: running totals at the start of ``date_from``, when
+            ``events`` only holds the events from that day on
+        :return: list of create values, one per day from ``date_from`` to
+            ``date_to``
+        """
+        now = fields.Datetime.now()
+        totals = Counter(totals)
+        vals_list = []
+        index = 0
+        day = date_from
+        while day <= date_to:
+            while index < len(events) and events[index][0] <= day:
+                _day, kind, delta = events[index]
+                totals[kind] += delta
+                index += 1
+            fleet = totals['primary_fleet'] + totals['holiday_fleet']
+            vals_list.append({
+                'date': day,
+                'fleet_count': fleet,
+                'assigned_count': totals['primary'],
+                'holiday_loan_count': totals['holiday_pump'],
+                'available_count': max(fleet - totals['primary'] - totals['holiday_pump'], 0),
+                'holiday_fleet_count': totals['holiday_fleet'],
+                'holiday_available_count': max(totals['holiday_fleet'] - totals['holiday_pump'], 0),
+                'computed_at': now,
+            })
+            day += timedelta(days=1)
+        return vals_list
+
+    @api.model
+    def _refresh_snapshots(self, date_from=None, date_to=None):
+        """Recompute the daily snapshots from ``date_from`` to ``date_to``.
+
+        Without ``date_from``, the snapshots are extended from the last one
+        or from the earliest change since the last refresh, and built from
+        the first installation on the first run.
+
+        :return: number of snapshots written
+        """
+        date_to = date_to or fields.Date.context_today(self)
+        if not date_from:
+            date_from = self._get_refresh_start()
+        if not date_from:
+            self.env['insulin.assignment.log'].flush_model(['installation_date'])
+            self.env.cr.execute(SQL("SELECT MIN(installation_date) FROM insulin_assignment_log"))
+            date_from = self.env.cr.fetchone()[0] or date_to
+        if date_from > date_to:
+            return 0
+
+        # Continue from the snapshot of the day before when there is one,
+        # loading only the events of the refreshed days
+        totals = self._get_start_totals(date_from)
+        events = self._load_events(date_from, date_to, events_from=date_from if totals is not None else None)
+        vals_list = self._sweep(events, date_from, date_to, totals)
+
+        self.env.cr.execute(SQL(
+            "DELETE FROM insulin_fleet_utilization WHERE date BETWEEN %s AND %s", date_from, date_to,
+        ))
+        self.invalidate_model()
+        self.create(vals_list)
+        _logger.info(
+            "Fleet utilization: %d daily snapshots refreshed from %s to %s",
+            len(vals_list), date_from, date_to,
+        )
+        return len(vals_list)
+
+    @api.model
+    def _cron_refresh_snapshots(self):
+        """Scheduled action extending the fleet utilization nightly."""
+        self._refresh_snapshots()
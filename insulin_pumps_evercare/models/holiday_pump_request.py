@@ -1,5 +1,9 @@
+from collections import defaultdict
+
 from odoo import api, fields, models
 
+from .replacement_demand import DEMAND_REQUEST_FIELDS
+
 
 class HolidayPumpRequest(models.Model):
     """Holiday pump requests submitted via public website form."""
@@ -8,6 +12,11 @@ class HolidayPumpRequest(models.Model):
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'submitted_date desc'
 
+    _sql_constraints = [
+        ('travel_dates_check', 'CHECK(travel_end_date >= travel_start_date)',
+         'The travel end date cannot be before the travel start date.')
+    ]
+
     name = fields.Char(
         string='Request Reference',
         readonly=True,
@@ -75,60 +84,157 @@ class HolidayPumpRequest(models.Model):
     )
     patient_internal_id = fields.Char(
         related='patient_id.patient_internal_id',
-        string='Patient Internal ID',
-        store=True
+        string='Patient Internal ID'
     )
 
     # Holiday Pump Assignment
     holiday_pump_id = fields.Many2one(
         'stock.lot',
         string='Assigned Holiday Pump',
+        index=True,
         domain="[('is_insulin_pump', '=', True), ('pump_type', '=', 'holiday'), ('pump_state', '=', 'available')]"
     )
 
+    reservation_ids = fields.One2many(
+        'insulin.holiday.pump.reservation',
+        'request_id',
+        string='Reservations'
+    )
+
+    @api.constrains('travel_start_date', 'travel_end_date')
+    def _check_travel_dates(self):
+        for record in self:
+            if record.travel_end_date < record.travel_start_date:
+                raise models.ValidationError("The travel end date cannot be before the travel start date.")
+
     def action_approve(self):
         for record in self:
             if not record.holiday_pump_id:
                 raise models.ValidationError("Please assign a holiday pump before approving.")
             
-            # Assign the holiday pump to the patient
+            # Commit the pump for the travel dates (fails on overlapping reservations)
+            record._reserve_holiday_pump()
+            
+            # Assign the holiday pump to the patient, which opens its
+            # assignment log; the loan starts with the trip
             record.holiday_pump_id.write({
                 'assigned_patient_id': record.patient_id.id,
                 'pump_state': 'assigned',
                 'assignment_type': 'holiday_pump'
             })
+            record.holiday_pump_id.current_assignment_log_id.installation_date = record.travel_start_date
             
             record.status = 'approved'
-            
-            # Log the assignment
-            self.env['insulin.assignment.log'].create({
-                'patient_id': record.patient_id.id,
-                'equipment_id': record.holiday_pump_id.id,
-                'assignment_type': 'holiday_pump',
-                'installation_date': record.travel_start_date,
-                'replacement_date': record.travel_end_date,
-            })
+
+    def _notify_helpdesk(self):
+        """Email the configured helpdesk address about these requests."""
+        helpdesk_email = self.env['insulin.pumps.settings']._get('helpdesk_email')
+        template = self.env.ref(
+            'insulin_pumps_evercare.mail_template_holiday_pump_request_helpdesk',
+            raise_if_not_found=False
+        )
+        if not self or not helpdesk_email or not template:
+            return
+        template.send_mail_batch(self.ids, email_values={'email_to': helpdesk_email})
 
     def action_reject(self):
+        self.reservation_ids.unlink()
         self.write({'status': 'rejected'})
 
+    def action_auto_allocate(self):
+        """Allocate a free holiday pump to each pending request.
+
+        Free pumps for all requests are found in a single query against the
+        reservation index; requests are then served by travel start date,
+        making sure requests of the same batch do not share a pump over
+        overlapping dates.
+        """
+        requests = self.filtered(
+            lambda r: r.status == 'pending' and not r.holiday_pump_id
+        ).sorted(lambda r: (r.travel_start_date, r.id))
+        free_pumps = self.env['insulin.holiday.pump.reservation']._find_free_pumps(requests)
+        
+        allocated_periods = defaultdict(list)
+        allocated = self.browse()
+        for record in requests:
+            for lot_id in free_pumps[record.id]:
+                if any(
+                    start <= record.travel_end_date and record.travel_start_date <= end
+                    for start, end in allocated_periods[lot_id]
+                ):
+                    continue
+                allocated_periods[lot_id].append((record.travel_start_date, record.travel_end_date))
+                record.holiday_pump_id = lot_id
+                allocated |= record
+                break
+        allocated._reserve_holiday_pump()
+        
+        unallocated = len(requests) - len(allocated)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Holiday Pumps Allocated',
+                'message': f"{len(allocated)} request(s) allocated, {unallocated} without a free holiday pump.",
+                'type': 'success' if not unallocated else 'warning',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
+
+    def _reserve_holiday_pump(self):
+        """Create or update the reservation of each request's holiday pump."""
+        vals_list = []
+        for record in self:
+            vals = {
+                'lot_id': record.holiday_pump_id.id,
+                'start_date': record.travel_start_date,
+                'end_date': record.travel_end_date,
+            }
+            if record.reservation_ids:
+                record.reservation_ids.write(vals)
+            else:
+                vals_list.append({**vals, 'request_id': record.id})
+        self.env['insulin.holiday.pump.reservation'].create(vals_list)
+
+    def write(self, vals):
+        result = super().write(vals)
+        # Keep existing reservations in line with the request
+        if {'holiday_pump_id', 'travel_start_date', 'travel_end_date'} & set(vals):
+            reserved = self.filtered('reservation_ids')
+            reserved.filtered(lambda r: not r.holiday_pump_id).reservation_ids.unlink()
+            reserved.filtered('holiday_pump_id')._reserve_holiday_pump()
+        if DEMAND_REQUEST_FIELDS & vals.keys():
+            self.env['insulin.replacement.demand']._invalidate_demand()
+        return result
+
     @api.model_create_multi
     def create(self, vals_list):
+        # Link requests to existing patients by serial number, resolving all
+        # serials in one query. Callers that already looked the pump up (the
+        # public form) pass patient_id directly.
+        serials = [
+            vals['main_pump_serial'] for vals in vals_list
+            if vals.get('main_pump_serial') and not vals.get('patient_id')
+        ]
+        lots_by_serial = self.env['stock.lot']._find_pumps_by_serials(serials)
+        
         for vals in vals_list:
             if vals.get('name', 'New') == 'New':
                 vals['name'] = self.env['ir.sequence'].next_by_code(
                     'insulin.holiday.pump.request'
                 ) or 'New'
             
-            # Try to link to existing patient by serial number
-            if vals.get('main_pump_serial'):
-                serial = vals['main_pump_serial'].strip()
-                lot = self.env['stock.lot'].search([
-                    ('name', '=ilike', serial),
-                    ('is_insulin_pump', '=', True),
-                ], limit=1)
+            if vals.get('main_pump_serial') and not vals.get('patient_id'):
+                lot = lots_by_serial.get(vals['main_pump_serial'].strip().upper())
                 if lot and lot.assigned_patient_id:
                     vals['patient_id'] = lot.assigned_patient_id.id
         
-        return super().create(vals_list)
+        requests = super().create(vals_list)
+        self.env['insulin.replacement.demand']._invalidate_demand()
+        return requests
 
+    def unlink(self):
+        result = super().unlink()
+        self.env['insulin.replacement.demand']._invalidate_demand()
+        return result
@@ -0,0 +1,143 @@
+from psycopg2.errors import ExclusionViolation
+
+from odoo import api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists, constraint_definition
+
+
+class HolidayPumpReservation(models.Model):
+    """Commitment of a holiday pump to a request over its travel dates.
+
+    The table carries a ``period`` daterange column generated from the
+    start and end dates, with a GiST exclusion constraint preventing two
+    reservations of the same pump from overlapping. The same index answers
+    "which pumps are free between A and B" in a single query.
+    """
+    _name = 'insulin.holiday.pump.reservation'
+    _description = 'Holiday Pump Reservation'
+    _order = 'start_date, lot_id'
+    _rec_name = 'lot_id'
+
+    lot_id = fields.Many2one(
+        'stock.lot',
+        string='Holiday Pump',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    request_id = fields.Many2one(
+        'insulin.holiday.pump.request',
+        string='Holiday Pump Request',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    patient_id = fields.Many2one(
+        related='request_id.patient_id',
+        string='Patient'
+    )
+    start_date = fields.Date(
+        string='Start Date',
+        required=True
+    )
+    end_date = fields.Date(
+        string='End Date',
+        required=True
+    )
+
+    def init(self):
+        super().init()
+        cr = self.env.cr
+        cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        if not column_exists(cr, self._table, 'period'):
+            cr.execute(SQL(
+                """
+                ALTER TABLE %s
+                  ADD COLUMN period daterange
+                  GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED
+                """,
+                SQL.identifier(self._table),
+            ))
+        if not constraint_definition(cr, self._table, 'insulin_holiday_pump_reservation_no_overlap'):
+            cr.execute(SQL(
+                """
+                ALTER TABLE %s
+                  ADD CONSTRAINT insulin_holiday_pump_reservation_no_overlap
+                  EXCLUDE USING gist (lot_id WITH =, period WITH &&)
+                """,
+                SQL.identifier(self._table),
+            ))
+
+    @api.constrains('start_date', 'end_date')
+    def _check_dates(self):
+        for reservation in self:
+            if reservation.end_date < reservation.start_date:
+                raise ValidationError("The reservation end date cannot be before its start date.")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        try:
+            with self.env.cr.savepoint():
+                reservations = super().create(vals_list)
+                self.flush_model()
+        except ExclusionViolation:
+            raise ValidationError(
+                "The holiday pump is already reserved for overlapping travel dates."
+            )
+        return reservations
+
+    def write(self, vals):
+        try:
+            with self.env.cr.savepoint():
+                result = super().write(vals)
+                self.flush_model()
+        except ExclusionViolation:
+            raise ValidationError(
+                "The holiday pump is already reserved for overlapping travel dates."
+            )
+        return result
+
+    @api.model
+    def _find_free_pumps(self, requests):
+        """Return the holiday pumps free over each request's travel dates.
+
+        A single query checks every candidate pump against the reservation
+        index. Only available pumps are offered: approving a request assigns
+        its pump right away, so a pump still on loan cannot be taken from
+        the patient who has it.
+
+        :param requests: ``insulin.holiday.pump.request`` records
+        :return: dict mapping request ids to lists of free lot ids, in
+            lot id order
+        """
+        if not requests:
+            return {}
+        self.env['insulin.holiday.pump.request'].flush_model(['travel_start_date', 'travel_end_date'])
+        self.env['stock.lot'].flush_model(['is_insulin_pump', 'pump_type', 'pump_state', 'is_rma_device'])
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            SELECT r.id, l.id
+              FROM insulin_holiday_pump_request r
+              JOIN stock_lot l
+                ON l.is_insulin_pump
+               AND l.pump_type = 'holiday'
+               AND l.pump_state = 'available'
+               AND NOT COALESCE(l.is_rma_device, FALSE)
+             WHERE r.id IN %s
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM insulin_holiday_pump_reservation res
+                     WHERE res.lot_id = l.id
+                       AND res.request_id != r.id
+                       AND res.period && daterange(r.travel_start_date, r.travel_end_date, '[]')
+               )
+          ORDER BY r.id, l.id
+            """,
+            tuple(requests.ids),
+        ))
+        free_pumps = {request_id: [] for request_id in requests.ids}
+        for request_id, lot_id in self.env.cr.fetchall():
+            free_pumps[request_id].append(lot_id)
+        return free_pumps
@@ -0,0 +1,148 @@
+import logging
+import threading
+from datetime import timedelta
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+
+class HolidayPumpSubmission(models.Model):
+    """Staging table for holiday pump requests submitted on the public form.
+
+    The website controller only stores the validated submission here; a
+    scheduled action turns pending submissions into holiday pump requests
+    in batches and notifies the helpdesk.
+    """
+    _name = 'insulin.holiday.pump.submission'
+    _description = 'Holiday Pump Request Submission'
+    _order = 'id desc'
+
+    patient_name = fields.Char(string='Patient Name', required=True)
+    main_pump_serial = fields.Char(string='Main Pump Serial Number', required=True)
+    contact_phone = fields.Char(string='Mobile Number', required=True)
+    contact_email = fields.Char(string='Contact Email')
+    travel_start_date = fields.Date(string='Travel Start Date', required=True)
+    travel_end_date = fields.Date(string='Travel End Date', required=True)
+    destination = fields.Char(string='Destination', required=True)
+    reason = fields.Text(string='Reason')
+    additional_notes = fields.Text(string='Additional Notes')
+    patient_id = fields.Many2one(
+        'res.partner',
+        string='Linked Patient'
+    )
+    ip_address = fields.Char(string='IP Address')
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ], string='State', default='pending', required=True, index=True)
+    request_id = fields.Many2one(
+        'insulin.holiday.pump.request',
+        string='Holiday Pump Request',
+        readonly=True
+    )
+    error_message = fields.Text(string='Error', readonly=True)
+
+    def init(self):
+        super().init()
+        # Recent submissions are counted per IP address and per serial by
+        # the website rate limit
+        create_index(
+            self.env.cr,
+            'insulin_holiday_pump_submission_ip_date_index',
+            self._table,
+            ['ip_address', 'create_date'],
+        )
+        create_index(
+            self.env.cr,
+            'insulin_holiday_pump_submission_serial_date_index',
+            self._table,
+            ['upper(main_pump_serial)', 'create_date'],
+        )
+
+    @api.model
+    def _is_rate_limited(self, ip_address, serial, limit, window):
+        """Whether the IP address or the serial reached ``limit`` submissions
+        over the last ``window``.
+
+        Unlike the in-memory buckets of the website controller, the staged
+        submissions are shared by every worker and survive restarts.
+        Concurrent submissions may each see the count below the limit, so
+        the limit can be exceeded by the number of simultaneous requests.
+
+        :param window: ``timedelta`` the submissions are counted over
+        """
+        self.flush_model(['ip_address', 'main_pump_serial'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT (SELECT COUNT(*) FROM insulin_holiday_pump_submission
+                     WHERE ip_address = %(ip_address)s AND create_date >= %(since)s),
+                   (SELECT COUNT(*) FROM insulin_holiday_pump_submission
+                     WHERE upper(main_pump_serial) = %(serial)s AND create_date >= %(since)s)
+            """,
+            ip_address=ip_address,
+            serial=serial.upper(),
+            since=fields.Datetime.now() - window,
+        ))
+        return max(self.env.cr.fetchone()) >= limit
+
+    def _prepare_request_vals(self):
+        self.ensure_one()
+        return {
+            'patient_name': self.patient_name,
+            'main_pump_serial': self.main_pump_serial,
+            'contact_phone': self.contact_phone,
+            'contact_email': self.contact_email,
+            'travel_start_date': self.travel_start_date,
+            'travel_end_date': self.travel_end_date,
+            'destination': self.destination,
+            'reason': self.reason,
+            'additional_notes': self.additional_notes,
+            'patient_id': self.patient_id.id,
+            'status': 'pending',
+        }
+
+    def _process(self):
+        """Create holiday pump requests for these submissions in one batch.
+
+        If the batch fails, submissions are retried one by one so a single
+        bad row does not block the others.
+        """
+        try:
+            with self.env.cr.savepoint():
+                requests = self.env['insulin.holiday.pump.request'].create(
+                    [submission._prepare_request_vals() for submission in self]
+                )
+        except Exception as e:
+            if len(self) > 1:
+                for submission in self:
+                    submission._process()
+            else:
+                _logger.exception("Holiday pump submission %s failed", self.id)
+                self.write({'state': 'failed', 'error_message': str(e)})
+            return
+        for submission, request_record in zip(self, requests):
+            submission.write({'state': 'processed', 'request_id': request_record.id})
+        requests._notify_helpdesk()
+
+    @api.model
+    def _cron_process_submissions(self):
+        """Scheduled action turning pending submissions into requests."""
+        batch_size = self.env['insulin.pumps.settings']._get('cron_batch_size') or 1000
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        while submissions := self.search([('state', '=', 'pending')], order='id', limit=batch_size):
+            submissions._process()
+            if auto_commit:
+                self.env.cr.commit()
+
+    @api.autovacuum
+    def _gc_processed_submissions(self):
+        """Remove processed submissions after 30 days; the requests remain."""
+        self.search([
+            ('state', '=', 'processed'),
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=30)),
+        ]).unlink()
@@ -1,4 +1,53 @@
 from odoo import api, fields, models
+from odoo.tools import SQL, frozendict, ormcache
+
+# Typed ``insulin_pumps.*`` settings with their defaults, which must match
+# the defaults of the settings form fields
+SETTINGS = {
+    'return_location_id': (int, 0),
+    'auto_return_holiday_pumps': (bool, False),
+    'replacement_alert_days': (int, 30),
+    'cron_batch_size': (int, 1000),
+    'bulk_job_threshold': (int, 500),
+    'default_allocated_quantity': (int, 10),
+    'default_critical_threshold': (int, 13),
+    'carry_over_allocations': (bool, False),
+    'enable_threshold_warnings': (bool, True),
+    'helpdesk_email': (str, 'tandemsupport@evercaremedical.eu'),
+}
+
+
+class InsulinPumpsSettings(models.AbstractModel):
+    """Typed, registry-level cache of the insulin pumps settings.
+
+    All settings are read in one query and parsed once per registry. Any
+    change to a system parameter clears the registry cache, so saving the
+    settings form invalidates the values in every worker.
+    """
+    _name = 'insulin.pumps.settings'
+    _description = 'Insulin Pumps Settings'
+
+    @api.model
+    @ormcache()
+    def _get_settings(self):
+        """Return the settings as a read-only dict keyed without prefix."""
+        self.env['ir.config_parameter'].flush_model(['key', 'value'])
+        self.env.cr.execute(SQL(
+            "SELECT key, value FROM ir_config_parameter WHERE key IN %s",
+            tuple(f'insulin_pumps.{key}' for key in SETTINGS),
+        ))
+        values = {key.removeprefix('insulin_pumps.'): value for key, value in self.env.cr.fetchall()}
+        settings = {}
+        for key, (cast, default) in SETTINGS.items():
+            try:
+                settings[key] = cast(values[key]) if values.get(key) else default
+            except ValueError:
+                settings[key] = default
+        return frozendict(settings)
+
+    @api.model
+    def _get(self, key):
+        return self._get_settings()[key]
 
 
 class ProductTemplate(models.Model):
@@ -15,6 +64,27 @@ class ProductTemplate(models.Model):
         default=False,
         help='Check if this product is used for RMA replacements only'
     )
+    is_insulin_consumable_product = fields.Boolean(
+        string='Insulin Pump Consumable',
+        default=False,
+        help='Check if deliveries of this product count towards patients\' monthly consumables usage'
+    )
+
+    def write(self, vals):
+        # The lots' pump and RMA flags are recomputed from these, outside of
+        # stock.lot write: move their device status counts along
+        if not {'is_insulin_pump_product', 'is_rma_product'} & vals.keys():
+            return super().write(vals)
+        Counter = self.env['insulin.device.status.counter']
+        lots = self.env['stock.lot'].with_context(active_test=False).search([
+            ('product_id.product_tmpl_id', 'in', self.ids),
+        ])
+        before = Counter._get_lot_keys(lots)
+        result = super().write(vals)
+        Counter._apply_deltas(before, Counter._get_lot_keys(lots))
+        if lots:
+            self.env['insulin.replacement.demand']._invalidate_demand()
+        return result
 
 
 class ResConfigSettings(models.TransientModel):
@@ -32,12 +102,29 @@ class ResConfigSettings(models.TransientModel):
         help='Location for returned devices',
         config_parameter='insulin_pumps.return_location_id',
     )
+    insulin_pumps_auto_return_holiday_pumps = fields.Boolean(
+        string='Auto-Return Overdue Holiday Pumps',
+        help='Unassign overdue holiday pumps that have been checked in at the return location',
+        config_parameter='insulin_pumps.auto_return_holiday_pumps',
+    )
     insulin_pumps_replacement_alert_days = fields.Integer(
         string='Replacement Alert Days',
         default=30,
         help='Days before replacement date to trigger alert',
         config_parameter='insulin_pumps.replacement_alert_days',
     )
+    insulin_pumps_cron_batch_size = fields.Integer(
+        string='Scheduled Action Batch Size',
+        default=1000,
+        help='Number of records processed per committed batch by scheduled actions',
+        config_parameter='insulin_pumps.cron_batch_size',
+    )
+    insulin_pumps_bulk_job_threshold = fields.Integer(
+        string='Background Bulk Action Threshold',
+        default=500,
+        help='Unassign and scrap actions on more devices than this run as a background job',
+        config_parameter='insulin_pumps.bulk_job_threshold',
+    )
     insulin_pumps_default_allocated_quantity = fields.Integer(
         string='Default Allocated Quantity',
         default=10,
@@ -50,6 +137,12 @@ class ResConfigSettings(models.TransientModel):
         help='Default monthly critical threshold for consumables',
         config_parameter='insulin_pumps.default_critical_threshold',
     )
+    insulin_pumps_carry_over_allocations = fields.Boolean(
+        string='Carry Over Allocation Overrides',
+        help='When creating the new month allocations, reuse each patient\'s allocated quantity '
+             'and threshold from the previous month instead of the defaults',
+        config_parameter='insulin_pumps.carry_over_allocations',
+    )
     insulin_pumps_enable_warnings = fields.Boolean(
         string='Enable Threshold Warnings',
         default=True,
@@ -61,3 +154,24 @@ class ResConfigSettings(models.TransientModel):
         config_parameter='insulin_pumps.helpdesk_email',
     )
 
+
+    def set_values(self):
+        """Refresh the data derived from settings that changed."""
+        Settings = self.env['insulin.pumps.settings']
+        old_settings = Settings._get_settings()
+        super().set_values()
+        self.env.registry.clear_cache()
+        new_settings = Settings._get_settings()
+        
+        if new_settings['replacement_alert_days'] != old_settings['replacement_alert_days']:
+            self.env['stock.lot']._refresh_replacement_alerts()
+        
+        changed_defaults = [
+            fname for fname, key in [
+                ('quantity_allocated', 'default_allocated_quantity'),
+                ('threshold', 'default_critical_threshold'),
+            ]
+            if new_settings[key] != old_settings[key]
+        ]
+        if changed_defaults:
+            self.env['insulin.consumables.allocation']._recompute_default_based_status(changed_defaults)
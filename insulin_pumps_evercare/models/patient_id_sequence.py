@@ -0,0 +1,71 @@
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+
+class PatientIdSequence(models.Model):
+    """Per-year counter backing patient internal ID generation."""
+    _name = 'insulin.patient.id.sequence'
+    _description = 'Patient Internal ID Sequence'
+    _order = 'year desc'
+
+    _sql_constraints = [
+        ('year_unique', 'unique(year)', 'A patient ID sequence already exists for this year.')
+    ]
+
+    year = fields.Integer(
+        string='Year',
+        required=True,
+        readonly=True
+    )
+    last_number = fields.Integer(
+        string='Last Number',
+        readonly=True,
+        help='Last sequence number handed out for this year'
+    )
+
+    @api.model
+    def _reserve(self, year, count):
+        """Reserve a contiguous block of ``count`` numbers for ``year``.
+
+        The counter row is incremented with a single UPDATE, which holds a
+        row lock until the transaction ends, so concurrent transactions get
+        disjoint blocks. On the first reservation of a year the counter is
+        seeded from the highest existing patient internal ID of that year.
+
+        :return: list of the reserved numbers, in increasing order
+        """
+        if count <= 0:
+            return []
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            UPDATE insulin_patient_id_sequence
+               SET last_number = last_number + %s
+             WHERE year = %s
+            RETURNING last_number
+            """,
+            count, year,
+        ))
+        row = self.env.cr.fetchone()
+        if not row:
+            self.env['res.partner'].flush_model(['patient_internal_id'])
+            self.env.cr.execute(SQL(
+                """
+                INSERT INTO insulin_patient_id_sequence (year, last_number, create_uid, create_date, write_uid, write_date)
+                SELECT %(year)s, COALESCE(MAX(split_part(patient_internal_id, '-', 2)::integer), 0) + %(count)s,
+                       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                  FROM res_partner
+                 WHERE patient_internal_id ~ %(pattern)s
+                ON CONFLICT (year) DO UPDATE
+                   SET last_number = insulin_patient_id_sequence.last_number + %(count)s
+                RETURNING last_number
+                """,
+                year=year,
+                count=count,
+                uid=self.env.uid,
+                pattern=f'^{year}-[0-9]+$',
+            ))
+            row = self.env.cr.fetchone()
+        self.invalidate_model(['last_number'])
+        last_number = row[0]
+        return list(range(last_number - count + 1, last_number + 1))
@@ -0,0 +1,259 @@
+import csv
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# CSV column -> res.partner field copied as-is
+PATIENT_COLUMNS = [
+    'name',
+    'email',
+    'patient_date_of_birth',
+    'patient_id_number',
+    'patient_phone',
+    'patient_locality',
+    'installation_date',
+    'holiday_pump_return_date',
+]
+DATE_COLUMNS = ['patient_date_of_birth', 'installation_date', 'holiday_pump_return_date']
+
+
+class PatientImport(models.AbstractModel):
+    """Bulk import of patients and their devices from CSV.
+
+    Expected columns are the fields in ``PATIENT_COLUMNS`` plus
+    ``training_location`` (name), ``primary_serial`` and ``holiday_serial``.
+    Usable from the import wizard or from an Odoo shell::
+
+        env['insulin.patient.import']._import_csv_file('/tmp/patients.csv', '/tmp/errors.csv')
+        env.cr.commit()
+    """
+    _name = 'insulin.patient.import'
+    _description = 'Patient Bulk Import'
+
+    @api.model
+    def _import_csv_file(self, path, error_report_path=None, chunk_size=None):
+        """Import patients from a CSV file on disk.
+
+        :return: tuple ``(imported_count, error_count)``
+        """
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            if not error_report_path:
+                return self._import_csv(stream, chunk_size=chunk_size)
+            with open(error_report_path, 'w', newline='', encoding='utf-8') as error_stream:
+                return self._import_csv(stream, chunk_size=chunk_size, error_stream=error_stream)
+
+    @api.model
+    def _import_csv(self, stream, chunk_size=None, error_stream=None, auto_commit=None):
+        """Stream patients from a CSV text stream and import them in chunks.
+
+        Each chunk resolves all its serials and training locations in one
+        lookup each, reserves its internal IDs in one round-trip and creates
+        partners, assignment logs and consumables allocations in batches.
+        Rows that fail validation are written to ``error_stream`` with an
+        extra ``error`` column. Chunks are committed as they complete.
+
+        :return: tuple ``(imported_count, error_count)``
+        """
+        started = time.monotonic()
+        if not chunk_size:
+            chunk_size = self.env['insulin.pumps.settings']._get('cron_batch_size') or 1000
+        if auto_commit is None:
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+
+        reader = csv.DictReader(stream)
+        error_writer = None
+        if error_stream is not None:
+            error_writer = csv.DictWriter(
+                error_stream, fieldnames=['line', *(reader.fieldnames or []), 'error'], extrasaction='ignore'
+            )
+            error_writer.writeheader()
+
+        rows = enumerate(reader, start=2)
+        seen_serials = set()
+        imported_count = error_count = 0
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            created, failures = self._import_chunk(chunk, seen_serials)
+            imported_count += created
+            error_count += len(failures)
+            if error_writer:
+                for line, row, error in failures:
+                    error_writer.writerow({**row, 'line': line, 'error': error})
+            if auto_commit:
+                self.env.cr.commit()
+
+        _logger.info(
+            "Patient import: %d patients imported, %d rows rejected in %.2fs",
+            imported_count, error_count, time.monotonic() - started,
+        )
+        return imported_count, error_count
+
+    @api.model
+    def _import_chunk(self, chunk, seen_serials):
+        """Validate and import one chunk of ``(line, row)`` pairs.
+
+        :param seen_serials: serials already used by earlier rows of the
+            file, updated in place
+        :return: tuple ``(created_count, failures)`` where failures is a list
+            of ``(line, row, error)``
+        """
+        lots_by_serial = self.env['stock.lot']._find_pumps_by_serials(
+            row.get(column) or '' for _line, row in chunk for column in ('primary_serial', 'holiday_serial')
+        )
+        location_names = {(row.get('training_location') or '').strip() for _line, row in chunk} - {''}
+        locations = self.env['insulin.training.location'].search([('name', 'in', list(location_names))])
+        location_by_name = {location.name: location for location in locations}
+
+        failures = []
+        valid = []
+        for line, row in chunk:
+            devices, error = self._validate_row(row, lots_by_serial, seen_serials)
+            if error:
+                failures.append((line, row, error))
+                continue
+            seen_serials.update(device.name.upper() for device in devices.values())
+            valid.append((line, row, devices))
+
+        if not valid:
+            return 0, failures
+
+        try:
+            with self.env.cr.savepoint():
+                self._create_patients(valid, location_by_name)
+        except Exception as e:
+            _logger.exception("Patient import: chunk starting at line %d failed", valid[0][0])
+            for line, row, devices in valid:
+                seen_serials.difference_update(device.name.upper() for device in devices.values())
+                failures.append((line, row, str(e)))
+            return 0, failures
+        return len(valid), failures
+
+    @api.model
+    def _validate_row(self, row, lots_by_serial, seen_serials):
+        """Check a row against the device assignment and RMA constraints.
+
+        :return: tuple ``(devices, error)`` where devices maps the assignment
+            type to the resolved ``stock.lot``
+        """
+        if not (row.get('name') or '').strip():
+            return {}, "Patient name is required."
+        for column in DATE_COLUMNS:
+            value = (row.get(column) or '').strip()
+            try:
+                if value:
+                    fields.Date.to_date(value)
+            except ValueError:
+                return {}, f"Invalid date '{value}' in column {column}, expected YYYY-MM-DD."
+
+        devices = {}
+        for column, assignment_type in (('primary_serial', 'primary'), ('holiday_serial', 'holiday_pump')):
+            serial = (row.get(column) or '').strip()
+            if not serial:
+                continue
+            lot = lots_by_serial.get(serial.upper())
+            if not lot:
+                return {}, f"Serial Number '{serial}' not found."
+            if lot.is_rma_device:
+                if assignment_type == 'primary':
+                    return {}, (
+                        f"RMA device '{lot.name}' cannot be assigned as an initial primary device. "
+                        "RMA devices can only be used as replacements for malfunctioning primary devices "
+                        "through the 'Replace Device' workflow."
+                    )
+                return {}, (
+                    f"RMA device '{lot.name}' cannot be assigned as a holiday pump. "
+                    "RMA devices can only be used as replacements for malfunctioning primary devices."
+                )
+            if lot.pump_state != 'available':
+                return {}, f"Device '{lot.name}' is not available (current state: {lot.pump_state})."
+            if lot.name.upper() in seen_serials or lot in devices.values():
+                return {}, f"Device '{lot.name}' is assigned to more than one patient in this file."
+            devices[assignment_type] = lot
+
+        if 'holiday_pump' in devices and not (row.get('holiday_pump_return_date') or '').strip():
+            return {}, "Holiday Pump Return Date is mandatory when a holiday pump is assigned."
+        return devices, None
+
+    @api.model
+    def _create_patients(self, valid, location_by_name):
+        """Create patients, device assignments and allocations for valid rows."""
+        today = fields.Date.today()
+        Partner = self.env['res.partner']
+        internal_ids = Partner._generate_patient_internal_ids(len(valid))
+
+        partner_vals_list = []
+        for (_line, row, devices), internal_id in zip(valid, internal_ids):
+            vals = {
+                column: (row.get(column) or '').strip() or False
+                for column in PATIENT_COLUMNS
+            }
+            location = location_by_name.get((row.get('training_location') or '').strip())
+            vals.update({
+                'is_patient': True,
+                'patient_internal_id': internal_id,
+                'installation_date': vals['installation_date'] or today,
+                'training_location_id': location.id if location else False,
+                'primary_device_id': devices['primary'].id if 'primary' in devices else False,
+                'holiday_pump_id': devices['holiday_pump'].id if 'holiday_pump' in devices else False,
+            })
+            partner_vals_list.append(vals)
+        partners = Partner.with_context(patient_import=True, skip_device_sync=True).create(partner_vals_list)
+
+        log_vals_list = []
+        lots_by_group = defaultdict(lambda: self.env['stock.lot'])
+        for partner, (_line, _row, devices) in zip(partners, valid):
+            for assignment_type, lot in devices.items():
+                lots_by_group[assignment_type, partner.installation_date] |= lot
+                log_vals_list.append({
+                    'patient_id': partner.id,
+                    'equipment_id': lot.id,
+                    'assignment_type': assignment_type,
+                    'installation_date': partner.installation_date,
+                })
+        self._assign_lots({vals['equipment_id']: vals['patient_id'] for vals in log_vals_list})
+        for (assignment_type, installation_date), lots in lots_by_group.items():
+            lots.with_context(skip_assignment_sync=True).write({
+                'pump_state': 'assigned',
+                'assignment_type': assignment_type,
+                'installation_date': installation_date,
+            })
+        self.env['insulin.assignment.log'].create(log_vals_list)
+
+        # Create initial consumables allocations for the current month
+        self.env['insulin.consumables.allocation'].create([{
+            'patient_id': partner.id,
+            'month': str(today.month),
+            'year': today.year,
+        } for partner in partners])
+        return partners
+
+    @api.model
+    def _assign_lots(self, patient_by_lot_id):
+        """Set the patient of many lots in one UPDATE.
+
+        The lots' other assignment fields are written through the ORM
+        afterwards, in one write per assignment type and installation
+        date, which runs the constraints and device counters.
+        """
+        if not patient_by_lot_id:
+            return
+        Lot = self.env['stock.lot']
+        Lot.flush_model(['assigned_patient_id'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE stock_lot lot
+               SET assigned_patient_id = v.patient_id
+              FROM (VALUES %s) AS v(lot_id, patient_id)
+             WHERE lot.id = v.lot_id
+            """,
+            SQL(", ").join(SQL("(%s, %s)", lot_id, patient_id) for lot_id, patient_id in patient_by_lot_id.items()),
+        ))
+        lots = Lot.browse(list(patient_by_lot_id))
+        lots.invalidate_recordset(['assigned_patient_id'])
+        lots.modified(['assigned_patient_id'])
@@ -0,0 +1,66 @@
+import base64
+import io
+
+from odoo import fields, models
+from odoo.exceptions import UserError
+
+
+class InsulinPatientImportWizard(models.TransientModel):
+    _name = 'insulin.patient.import.wizard'
+    _description = 'Import Insulin Pump Patients'
+
+    data_file = fields.Binary(
+        string='CSV File',
+        required=True
+    )
+    filename = fields.Char(string='File Name')
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+    ], string='State', default='draft')
+
+    # Results
+    imported_count = fields.Integer(
+        string='Imported Patients',
+        readonly=True
+    )
+    error_count = fields.Integer(
+        string='Rejected Rows',
+        readonly=True
+    )
+    error_report = fields.Binary(
+        string='Error Report',
+        readonly=True
+    )
+    error_report_name = fields.Char(
+        string='Error Report Name',
+        readonly=True
+    )
+
+    def action_import(self):
+        """Run the bulk patient import and show the results."""
+        self.ensure_one()
+        try:
+            content = base64.b64decode(self.data_file).decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise UserError("The file must be a UTF-8 encoded CSV file.")
+
+        error_stream = io.StringIO()
+        imported_count, error_count = self.env['insulin.patient.import']._import_csv(
+            io.StringIO(content, newline=''), error_stream=error_stream
+        )
+        self.write({
+            'state': 'done',
+            'imported_count': imported_count,
+            'error_count': error_count,
+            'error_report': base64.b64encode(error_stream.getvalue().encode()) if error_count else False,
+            'error_report_name': 'patient_import_errors.csv' if error_count else False,
+        })
+        return {
+            'name': 'Import Patients',
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -111,13 +111,8 @@ class InsulinReplaceDeviceWizard(models.TransientModel):
         notes_text = f" Notes: {self.replacement_notes}" if self.replacement_notes else ""
         
         # 1. Set replacement date on old device assignment log
-        old_log = self.env['insulin.assignment.log'].search([
-            ('patient_id', '=', patient.id),
-            ('equipment_id', '=', old_device.id),
-            ('assignment_type', '=', 'primary'),
-            ('replacement_date', '=', False),
-        ], limit=1)
-        if old_log:
+        old_log = old_device.current_assignment_log_id
+        if old_log.patient_id == patient and old_log.assignment_type == 'primary':
             old_log.replacement_date = fields.Date.today()
         
         # 2. Unlink old device from patient and set state to 'available'
@@ -150,27 +145,28 @@ class InsulinReplaceDeviceWizard(models.TransientModel):
             'installation_date': fields.Date.today(),
         })
         
-        # 7. Leave notes in chatter
+        # 7. Leave notes in chatter, logged in bulk when the transaction commits
+        ChatterBuffer = self.env['insulin.chatter.buffer']
         # Patient chatter message
         patient_msg = (
             f"Primary device SN {old_device.name} replaced with RMA device SN {new_device.name}. "
             f"Reason: {reason_label}.{notes_text}"
         )
-        patient.message_post(body=patient_msg, message_type='notification')
+        ChatterBuffer._add_note(patient, patient_msg)
         
         # Old device chatter message
         old_device_msg = (
             f"Replaced for Patient ID {patient.patient_internal_id}. "
             f"Reason: {reason_label}.{notes_text}"
         )
-        old_device.message_post(body=old_device_msg, message_type='notification')
+        ChatterBuffer._add_note(old_device, old_device_msg)
         
         # New device chatter message
         new_device_msg = (
             f"Assigned to Patient ID {patient.patient_internal_id} as replacement "
             f"for SN {old_device.name}."
         )
-        new_device.message_post(body=new_device_msg, message_type='notification')
+        ChatterBuffer._add_note(new_device, new_device_msg)
         
         return {
             'type': 'ir.actions.client',
@@ -187,52 +183,7 @@ class InsulinReplaceDeviceWizard(models.TransientModel):
     def _transfer_to_return_location(self, device):
         """Transfer device to the configured return location.
         
-        Creates a stock move to transfer the device to the return location
+        Creates a stock picking to transfer the device to the return location
         if configured in settings.
         """
-        # Get return location from settings
-        return_location_id = int(self.env['ir.config_parameter'].sudo().get_param(
-            'insulin_pumps.return_location_id', default=0
-        ))
-        
-        if not return_location_id:
-            # No return location configured, skip transfer
-            return
-        
-        return_location = self.env['stock.location'].browse(return_location_id)
-        if not return_location.exists():
-            return
-        
-        # Find current location of the device via stock.quant
-        quant = self.env['stock.quant'].search([
-            ('lot_id', '=', device.id),
-            ('quantity', '>', 0),
-            ('location_id.usage', '=', 'internal'),
-        ], limit=1)
-        
-        if quant and quant.location_id.id != return_location.id:
-            # Create stock move to return location
-            move_vals = {
-                'name': f'Return: {device.name}',
-                'product_id': device.product_id.id,
-                'product_uom_qty': 1,
-                'product_uom': device.product_id.uom_id.id,
-                'location_id': quant.location_id.id,
-                'location_dest_id': return_location.id,
-                'lot_ids': [(4, device.id)],
-                'state': 'draft',
-            }
-            
-            move = self.env['stock.move'].create(move_vals)
-            move._action_confirm()
-            move._action_assign()
-            
-            # Force assign the lot to the move line
-            for move_line in move.move_line_ids:
-                move_line.lot_id = device.id
-                move_line.quantity = 1
-            
-            move._action_done()
-
-
-
+        return self.env['insulin.device.movement']._move_to_return_location(device)
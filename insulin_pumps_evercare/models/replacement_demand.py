@@ -0,0 +1,248 @@
+import logging
+from collections import defaultdict
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+from odoo.tools import SQL, frozendict, ormcache
+
+_logger = logging.getLogger(__name__)
+
+# Months ahead covered by the procurement report
+DEMAND_HORIZON_MONTHS = 12
+
+# stock.lot fields the replacement demand depends on
+DEMAND_LOT_FIELDS = {
+    'product_id', 'pump_state', 'pump_type', 'assignment_type', 'installation_date', 'lifespan_years',
+}
+# insulin.holiday.pump.request fields the holiday demand depends on
+DEMAND_REQUEST_FIELDS = {'status', 'travel_start_date', 'travel_end_date'}
+
+# Version of the data the demand is computed from; a sequence, so that
+# bumping it neither locks a row nor conflicts between transactions
+VERSION_SEQUENCE = 'insulin_replacement_demand_version_seq'
+
+
+class ReplacementDemand(models.AbstractModel):
+    """Monthly insulin pump demand against the stock available to meet it.
+
+    Primary devices due for replacement are bucketed per month and product
+    in one grouped query, overdue ones falling in the first month. They
+    draw, month after month, on the available stock of their product then
+    on the shared pool of available RMA devices. Holiday pump demand is the
+    peak number of concurrent trips in each month, met by the holiday pump
+    fleet. The result is kept in the registry cache, keyed on a version
+    number bumped once a lot or holiday request change affecting it has
+    committed.
+    """
+    _name = 'insulin.replacement.demand'
+    _description = 'Insulin Pump Replacement Demand'
+
+    def init(self):
+        super().init()
+        self.env.cr.execute(SQL("CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier(VERSION_SEQUENCE)))
+
+    @api.model
+    def _invalidate_demand(self):
+        """Bump the demand version once this transaction has committed.
+
+        Bumping after the commit keeps other transactions from caching a
+        demand computed without the changes under the new version; cached
+        entries of older versions are simply no longer looked up.
+        """
+        postcommit = self.env.cr.postcommit
+        if VERSION_SEQUENCE in postcommit.data:
+            return
+        postcommit.data[VERSION_SEQUENCE] = True
+        postcommit.add(self._bump_version)
+
+    @api.model
+    def _bump_version(self):
+        # nextval is not transactional: it holds even though the cursor's
+        # next transaction is never committed
+        self.env.cr.execute(SQL("SELECT nextval(%s)", VERSION_SEQUENCE))
+
+    @api.model
+    def _get_demand(self, first_month, months):
+        """Return the demand lines of ``months`` months from ``first_month``.
+
+        :return: tuple of read-only dicts with the month, line type, product
+            id, demand, the quantities met from product and RMA stock and
+            the shortfall
+        """
+        if VERSION_SEQUENCE in self.env.cr.postcommit.data:
+            # Uncommitted changes of this transaction must neither be missed
+            # nor cached for other transactions
+            return self._compute_demand(first_month, months)
+        self.env.cr.execute(SQL("SELECT last_value FROM %s", SQL.identifier(VERSION_SEQUENCE)))
+        version = self.env.cr.fetchone()[0]
+        return self._get_cached_demand(first_month, months, version)
+
+    @api.model
+    @ormcache('first_month', 'months', 'version')
+    def _get_cached_demand(self, first_month, months, version):
+        return self._compute_demand(first_month, months)
+
+    @api.model
+    def _compute_demand(self, first_month, months):
+        """Compute the demand lines returned by ``_get_demand``."""
+        horizon_end = first_month + relativedelta(months=months)
+        self.env['stock.lot'].flush_model([
+            'is_insulin_pump', 'is_rma_device', 'product_id', 'pump_state', 'pump_type',
+            'assignment_type', 'replacement_date',
+        ])
+        self.env['insulin.holiday.pump.request'].flush_model(DEMAND_REQUEST_FIELDS)
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT GREATEST(date_trunc('month', replacement_date)::date, %(first_month)s), product_id, COUNT(*)
+              FROM stock_lot
+             WHERE is_insulin_pump
+               AND pump_state = 'assigned'
+               AND assignment_type = 'primary'
+               AND replacement_date < %(horizon_end)s
+          GROUP BY 1, 2
+          ORDER BY 1, 2
+            """,
+            first_month=first_month,
+            horizon_end=horizon_end,
+        ))
+        replacements = self.env.cr.fetchall()
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT product_id, is_rma_device, COUNT(*)
+              FROM stock_lot
+             WHERE is_insulin_pump
+               AND pump_state = 'available'
+               AND pump_type = 'primary'
+          GROUP BY 1, 2
+            """
+        ))
+        product_stock = defaultdict(int)
+        rma_stock = 0
+        for product_id, is_rma_device, count in self.env.cr.fetchall():
+            if is_rma_device:
+                rma_stock += count
+            else:
+                product_stock[product_id] += count
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT COUNT(*)
+              FROM stock_lot
+             WHERE is_insulin_pump
+               AND pump_type = 'holiday'
+               AND pump_state != 'scrapped'
+            """
+        ))
+        holiday_fleet = self.env.cr.fetchone()[0]
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT date_trunc('month', day)::date, MAX(trips)
+              FROM (
+                    SELECT day, COUNT(request.id) AS trips
+                      FROM generate_series(%(first_month)s::date, %(horizon_end)s::date - 1, '1 day') AS day
+                 LEFT JOIN insulin_holiday_pump_request request
+                        ON request.status IN ('pending', 'approved')
+                       AND day BETWEEN request.travel_start_date AND request.travel_end_date
+                  GROUP BY day
+                   ) daily
+          GROUP BY 1
+          ORDER BY 1
+            """,
+            first_month=first_month,
+            horizon_end=horizon_end,
+        ))
+        holiday_demand = dict(self.env.cr.fetchall())
+
+        lines = []
+        for month, product_id, due in replacements:
+            from_stock = min(due, product_stock[product_id])
+            product_stock[product_id] -= from_stock
+            from_rma = min(due - from_stock, rma_stock)
+            rma_stock -= from_rma
+            lines.append(frozendict({
+                'month': month,
+                'line_type': 'replacement',
+                'product_id': product_id,
+                'demand_count': due,
+                'stock_count': from_stock,
+                'rma_count': from_rma,
+                'shortfall_count': due - from_stock - from_rma,
+            }))
+        for month, trips in holiday_demand.items():
+            if not trips:
+                continue
+            lines.append(frozendict({
+                'month': month,
+                'line_type': 'holiday',
+                'product_id': False,
+                'demand_count': trips,
+                'stock_count': min(trips, holiday_fleet),
+                'rma_count': 0,
+                'shortfall_count': max(trips - holiday_fleet, 0),
+            }))
+        _logger.info(
+            "Replacement demand computed from %s: %d lines, %d devices short",
+            first_month, len(lines), sum(line['shortfall_count'] for line in lines),
+        )
+        return tuple(lines)
+
+    @api.model
+    def action_open_report(self):
+        """Show the demand of the coming months as report lines."""
+        first_month = fields.Date.context_today(self).replace(day=1)
+        lines = self.env['insulin.replacement.demand.line'].create([
+            dict(line) for line in self._get_demand(first_month, DEMAND_HORIZON_MONTHS)
+        ])
+        return {
+            'name': 'Replacement Demand',
+            'type': 'ir.actions.act_window',
+            'res_model': 'insulin.replacement.demand.line',
+            'view_mode': 'list,pivot',
+            'domain': [('id', 'in', lines.ids)],
+            'context': {'search_default_group_month': 1},
+        }
+
+
+class ReplacementDemandLine(models.TransientModel):
+    """One month of demand for a product or for holiday pumps."""
+    _name = 'insulin.replacement.demand.line'
+    _description = 'Insulin Pump Replacement Demand Line'
+    _order = 'month, line_type desc, product_id'
+
+    month = fields.Date(
+        string='Month',
+        readonly=True
+    )
+    line_type = fields.Selection([
+        ('replacement', 'Replacement'),
+        ('holiday', 'Holiday Pumps'),
+    ], string='Demand', readonly=True)
+    product_id = fields.Many2one(
+        'product.product',
+        string='Product',
+        readonly=True
+    )
+    demand_count = fields.Integer(
+        string='Devices Needed',
+        readonly=True,
+        help='Replacements due this month, overdue ones included in the first month, '
+             'or the peak number of concurrent holiday trips'
+    )
+    stock_count = fields.Integer(
+        string='From Stock',
+        readonly=True,
+        help='Devices met from the available stock of the product or the holiday pump fleet'
+    )
+    rma_count = fields.Integer(
+        string='From RMA Pool',
+        readonly=True
+    )
+    shortfall_count = fields.Integer(
+        string='Shortfall',
+        readonly=True,
+        help='Devices to procure for this month'
+    )
@@ -1,10 +1,27 @@
+import threading
+
 from odoo import api, fields, models
+from odoo.tools import SQL
+
+# Stored copies of the patient internal ID, as (table, patient column).
+# They are kept because list views sort on them; other models use plain
+# non-stored related fields.
+PATIENT_INTERNAL_ID_COPIES = [
+    ('stock_lot', 'assigned_patient_id'),
+    ('insulin_assignment_log', 'patient_id'),
+    ('insulin_consumables_allocation', 'patient_id'),
+]
 
 
 class ResPartner(models.Model):
     """Extend res.partner to add patient-specific fields."""
     _inherit = 'res.partner'
 
+    _sql_constraints = [
+        ('patient_internal_id_unique', 'unique(patient_internal_id)',
+         'The Patient Internal ID must be unique.')
+    ]
+
     is_patient = fields.Boolean(
         string='Is Patient',
         default=False,
@@ -50,7 +67,8 @@ class ResPartner(models.Model):
         domain="[('is_insulin_pump', '=', True), ('pump_state', '=', 'available')]"
     )
     holiday_pump_return_date = fields.Date(
-        string='Holiday Pump Return Date'
+        string='Holiday Pump Return Date',
+        index=True
     )
     
     # Training location
@@ -73,12 +91,44 @@ class ResPartner(models.Model):
         string='Consumables Allocations'
     )
 
+    # Current month consumables and primary device expiry, stored so the
+    # patient list can sort and filter on them without joins
+    current_allocated_quantity = fields.Integer(
+        string='Allocated This Month',
+        compute='_compute_current_consumables',
+        store=True
+    )
+    current_used_quantity = fields.Integer(
+        string='Used This Month',
+        compute='_compute_current_consumables',
+        store=True
+    )
+    current_threshold_status = fields.Selection([
+        ('green', 'Normal'),
+        ('orange', 'Warning'),
+        ('red', 'Exceeded'),
+    ], string='Consumables Status', compute='_compute_current_consumables', store=True, index=True)
+    primary_device_replacement_date = fields.Date(
+        related='primary_device_id.replacement_date',
+        string='Primary Device Expiry',
+        store=True,
+        index=True
+    )
+
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            if vals.get('is_patient') and not vals.get('patient_internal_id'):
-                vals['patient_internal_id'] = self._generate_patient_internal_id()
+        # Hand out internal IDs for the whole batch in one round-trip
+        to_number = [
+            vals for vals in vals_list
+            if vals.get('is_patient') and not vals.get('patient_internal_id')
+        ]
+        internal_ids = self._generate_patient_internal_ids(len(to_number))
+        for vals, internal_id in zip(to_number, internal_ids):
+            vals['patient_internal_id'] = internal_id
         records = super().create(vals_list)
+        # The bulk import pipeline assigns devices and allocations itself
+        if self.env.context.get('patient_import'):
+            return records
         # Handle device assignments for newly created patients
         for record in records:
             if record.is_patient:
@@ -90,6 +140,61 @@ class ResPartner(models.Model):
                 record._create_initial_consumables_allocation()
         return records
 
+    @api.depends(
+        'consumables_allocation_ids.month',
+        'consumables_allocation_ids.year',
+        'consumables_allocation_ids.quantity_allocated',
+        'consumables_allocation_ids.quantity_used',
+        'consumables_allocation_ids.threshold_status',
+    )
+    def _compute_current_consumables(self):
+        """Copy the current month's allocation onto the patient, one query per batch."""
+        today = fields.Date.today()
+        allocations = self.env['insulin.consumables.allocation'].search([
+            ('patient_id', 'in', self.filtered('id').ids),
+            ('month', '=', str(today.month)),
+            ('year', '=', today.year),
+        ])
+        allocation_by_patient = {allocation.patient_id.id: allocation for allocation in allocations}
+        for partner in self:
+            allocation = allocation_by_patient.get(partner.id)
+            partner.current_allocated_quantity = allocation.quantity_allocated if allocation else 0
+            partner.current_used_quantity = allocation.quantity_used if allocation else 0
+            partner.current_threshold_status = allocation.threshold_status if allocation else False
+
+    @api.model
+    def _refresh_current_consumables(self, patients=None):
+        """Recompute the current month consumables columns in committed batches.
+
+        Used when the month rolls over, since the stored values only follow
+        allocation changes, not the calendar.
+        """
+        if patients is None:
+            patients = self.search([('is_patient', '=', True)], order='id')
+        batch_size = self.env['insulin.pumps.settings']._get('cron_batch_size') or 1000
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        fields_to_compute = [self._fields[name] for name in (
+            'current_allocated_quantity', 'current_used_quantity', 'current_threshold_status',
+        )]
+        for offset in range(0, len(patients), batch_size):
+            batch = patients[offset:offset + batch_size]
+            for field in fields_to_compute:
+                self.env.add_to_compute(field, batch)
+            batch.flush_recordset(['current_allocated_quantity', 'current_used_quantity', 'current_threshold_status'])
+            if auto_commit:
+                self.env.cr.commit()
+
+    @api.model
+    def _cron_month_rollover(self):
+        """Scheduled action run at the start of each month.
+
+        Creates the new month's consumables allocations for all active
+        patients, then refreshes the current month columns.
+        """
+        today = fields.Date.today()
+        self.env['insulin.consumables.allocation']._create_month_allocations(today.year, today.month)
+        self._refresh_current_consumables()
+
     def _create_initial_consumables_allocation(self):
         """Create a consumables allocation record for the current month."""
         self.ensure_one()
@@ -112,9 +217,12 @@ class ResPartner(models.Model):
             })
 
     def write(self, vals):
-        # Skip device sync if called from stock.lot to prevent recursion
+        # Skip device sync if called from stock.lot to prevent recursion, and
+        # tracking as the calling workflow leaves its own notes
         if self.env.context.get('skip_device_sync'):
-            return super().write(vals)
+            result = super(ResPartner, self.with_context(mail_notrack=True)).write(vals)
+            self._propagate_patient_columns(vals)
+            return result
         
         # Track device changes for patients
         if 'primary_device_id' in vals or 'holiday_pump_id' in vals:
@@ -158,27 +266,65 @@ class ResPartner(models.Model):
                 
                 if 'primary_device_id' in vals and record.primary_device_id:
                     # Check if this device already has an active assignment log for this patient
-                    existing_log = self.env['insulin.assignment.log'].search([
-                        ('patient_id', '=', record.id),
-                        ('equipment_id', '=', record.primary_device_id.id),
-                        ('assignment_type', '=', 'primary'),
-                        ('replacement_date', '=', False),
-                    ], limit=1)
-                    if not existing_log:
+                    existing_log = record.primary_device_id.current_assignment_log_id
+                    if not (existing_log.patient_id == record and existing_log.assignment_type == 'primary'):
                         record._assign_device(record.primary_device_id, 'primary')
                 
                 if 'holiday_pump_id' in vals and record.holiday_pump_id:
-                    existing_log = self.env['insulin.assignment.log'].search([
-                        ('patient_id', '=', record.id),
-                        ('equipment_id', '=', record.holiday_pump_id.id),
-                        ('assignment_type', '=', 'holiday_pump'),
-                        ('replacement_date', '=', False),
-                    ], limit=1)
-                    if not existing_log:
+                    existing_log = record.holiday_pump_id.current_assignment_log_id
+                    if not (existing_log.patient_id == record and existing_log.assignment_type == 'holiday_pump'):
                         record._assign_device(record.holiday_pump_id, 'holiday_pump')
         
+        self._propagate_patient_columns(vals)
         return result
 
+    def _propagate_patient_columns(self, vals):
+        """Copy patient columns changed by ``vals`` to their stored copies.
+
+        Runs one set-based UPDATE per copy table instead of the ORM cascade
+        of related fields; rows whose copy already matches are not touched,
+        so writes that do not really change the value cost no row updates.
+        """
+        if not self or not {'patient_internal_id', 'name'} & vals.keys():
+            return
+        cr = self.env.cr
+        self.flush_recordset(['patient_internal_id', 'name'])
+        if 'patient_internal_id' in vals:
+            for table, patient_column in PATIENT_INTERNAL_ID_COPIES:
+                cr.execute(SQL(
+                    """
+                    UPDATE %(table)s target
+                       SET patient_internal_id = p.patient_internal_id
+                      FROM res_partner p
+                     WHERE p.id = target.%(patient_column)s
+                       AND p.id IN %(ids)s
+                       AND target.patient_internal_id IS DISTINCT FROM p.patient_internal_id
+                    """,
+                    table=SQL.identifier(table),
+                    patient_column=SQL.identifier(patient_column),
+                    ids=tuple(self.ids),
+                ))
+            self.env['stock.lot'].invalidate_model(['patient_internal_id'])
+            self.env['insulin.assignment.log'].invalidate_model(['patient_internal_id'])
+            self.env['insulin.consumables.allocation'].invalidate_model(['patient_internal_id'])
+        if 'name' in vals:
+            # Allocation names embed the patient name
+            month_names = self.env['insulin.consumables.allocation']._fields['month'].selection
+            cr.execute(SQL(
+                """
+                UPDATE insulin_consumables_allocation a
+                   SET display_name = CONCAT(COALESCE(p.name, 'Unknown'), ' - ', m.name, ' ', a.year)
+                  FROM res_partner p, (VALUES %(months)s) AS m(month, name)
+                 WHERE p.id = a.patient_id
+                   AND m.month = a.month
+                   AND p.id IN %(ids)s
+                   AND a.display_name IS DISTINCT FROM CONCAT(COALESCE(p.name, 'Unknown'), ' - ', m.name, ' ', a.year)
+                """,
+                months=SQL(", ").join(SQL("(%s, %s)", month, name) for month, name in month_names),
+                ids=tuple(self.ids),
+            ))
+            self.env['insulin.consumables.allocation'].invalidate_model(['display_name'])
+
     def _assign_device(self, device, assignment_type):
         """Assign a device to this patient.
         
@@ -210,24 +356,19 @@ class ResPartner(models.Model):
 
     def _generate_patient_internal_id(self):
         """Generate patient internal ID in format YYYY-NNN."""
+        return self._generate_patient_internal_ids(1)[0]
+
+    @api.model
+    def _generate_patient_internal_ids(self, count):
+        """Generate ``count`` patient internal IDs in format YYYY-NNN.
+
+        Numbers come from a row-locked per-year counter, so concurrent
+        creates never hand out the same ID and numbering keeps increasing
+        past 999 patients per year.
+        """
         current_year = fields.Date.today().year
-        
-        # Find the highest sequence number for this year
-        last_patient = self.search([
-            ('is_patient', '=', True),
-            ('patient_internal_id', 'like', f'{current_year}-%')
-        ], order='patient_internal_id desc', limit=1)
-        
-        if last_patient and last_patient.patient_internal_id:
-            try:
-                last_seq = int(last_patient.patient_internal_id.split('-')[1])
-            except (ValueError, IndexError):
-                last_seq = 0
-        else:
-            last_seq = 0
-        
-        new_seq = last_seq + 1
-        return f'{current_year}-{new_seq:03d}'
+        numbers = self.env['insulin.patient.id.sequence'].sudo()._reserve(current_year, count)
+        return [f'{current_year}-{number:03d}' for number in numbers]
 
     @api.constrains('is_patient', 'is_company')
     def _check_patient_not_company(self):
@@ -257,18 +398,26 @@ class ResPartner(models.Model):
         if self.env.context.get('allow_rma_assignment') or self.env.context.get('skip_device_sync'):
             return
         
-        for partner in self:
-            if not partner.is_patient:
-                continue
-            
+        patients = self.filtered('is_patient')
+        rma_primary = patients.primary_device_id.filtered('is_rma_device')
+        # (device, patient) pairs with assignment logs, in one grouped query;
+        # the assignment counter spares it when no RMA device has any log
+        logged = set()
+        if rma_primary.filtered('assignment_count'):
+            logged = {
+                (device.id, patient.id)
+                for device, patient in self.env['insulin.assignment.log']._read_group(
+                    [('equipment_id', 'in', rma_primary.ids), ('patient_id', 'in', patients.ids)],
+                    ['equipment_id', 'patient_id'],
+                )
+            }
+        
+        for partner in patients:
             # Check primary device
             if partner.primary_device_id and partner.primary_device_id.is_rma_device:
-                # Check if this device already has assignment logs (meaning it was properly assigned via replacement)
-                existing_logs = self.env['insulin.assignment.log'].search([
-                    ('equipment_id', '=', partner.primary_device_id.id),
-                    ('patient_id', '=', partner.id),
-                ])
-                if not existing_logs:
+                # The device must already have an assignment log for this patient
+                # (meaning it was properly assigned via replacement)
+                if (partner.primary_device_id.id, partner.id) not in logged:
                     raise models.ValidationError(
                         f"RMA device '{partner.primary_device_id.name}' cannot be assigned as an initial primary device. "
                         "RMA devices can only be used as replacements for malfunctioning primary devices "
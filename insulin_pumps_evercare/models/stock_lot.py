@@ -1,7 +1,22 @@
+import logging
+import threading
+import time
+from collections import defaultdict
 from datetime import timedelta
 
+from markupsafe import Markup
+from psycopg2.errors import UniqueViolation
+
 from odoo import api, fields, models
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from odoo.tools.sql import create_index, index_exists
+
+from .replacement_demand import DEMAND_LOT_FIELDS
+
+_logger = logging.getLogger(__name__)
+
+SINGLE_DEVICE_INDEX = 'stock_lot_single_device_per_type_index'
 
 
 class StockLot(models.Model):
@@ -18,6 +33,7 @@ class StockLot(models.Model):
         string='Replacement Date',
         compute='_compute_replacement_date',
         store=True,
+        index=True,
         help='Expected date when this device should be replaced'
     )
 
@@ -27,6 +43,13 @@ class StockLot(models.Model):
         store=True
     )
 
+    serial_normalized = fields.Char(
+        string='Normalized Serial Number',
+        compute='_compute_serial_normalized',
+        store=True,
+        help='Upper-cased, stripped serial number used for case-insensitive lookups'
+    )
+
     is_insulin_pump = fields.Boolean(
         string='Is Insulin Pump',
         compute='_compute_is_insulin_pump',
@@ -58,9 +81,10 @@ class StockLot(models.Model):
     
     installation_date = fields.Date(string='Installation Date')
     
-    # Related patient fields for list view
+    # Patient ID copy for sorting the list view; kept in sync with the
+    # patient by res.partner._propagate_patient_columns()
     patient_internal_id = fields.Char(
-        related='assigned_patient_id.patient_internal_id',
+        compute='_compute_patient_internal_id',
         string='Patient Internal ID',
         store=True
     )
@@ -72,6 +96,27 @@ class StockLot(models.Model):
         string='Assignment History'
     )
 
+    current_assignment_log_id = fields.Many2one(
+        'insulin.assignment.log',
+        string='Current Assignment Log',
+        compute='_compute_current_assignment_log_id',
+        store=True,
+        help='Open assignment log of the device for its current assignment type'
+    )
+
+    assignment_count = fields.Integer(
+        string='Assignment Count',
+        compute='_compute_assignment_stats',
+        store=True,
+        index=True,
+        help='Number of assignment log entries recorded for this device'
+    )
+    first_assignment_date = fields.Date(
+        string='First Assigned On',
+        compute='_compute_assignment_stats',
+        store=True
+    )
+
     is_rma_device = fields.Boolean(
         string='Is RMA Device',
         compute='_compute_is_rma_device',
@@ -80,149 +125,359 @@ class StockLot(models.Model):
     )
 
     def write(self, vals):
-        """Handle assignment changes when editing from the Equipment form."""
+        """Handle assignment changes when editing from the Equipment form.
+
+        Assignment sync runs on the whole recordset at once: open assignment
+        logs are fetched in one query, new logs are created in one batch and
+        old logs are closed in one write, so mass reassignments from a list
+        view do not issue queries per lot. Internal sync writes
+        (``skip_device_sync``) are not tracked: the workflow issuing them
+        leaves its own notes.
+        """
+        if self.env.context.get('skip_device_sync'):
+            self = self.with_context(mail_notrack=True)
+        # Internal writes that already handled the assignment bookkeeping
+        if self.env.context.get('skip_assignment_sync'):
+            return self._write_and_count(vals)
+        
+        AssignmentLog = self.env['insulin.assignment.log']
+        ChatterBuffer = self.env['insulin.chatter.buffer']
+        
         # Track patient assignment changes
         if 'assigned_patient_id' in vals:
-            for record in self:
-                if not record.is_insulin_pump:
-                    continue
-                
-                old_patient = record.assigned_patient_id
-                new_patient_id = vals.get('assigned_patient_id')
+            new_patient_id = vals.get('assigned_patient_id')
+            
+            # Devices leaving their current patient (skip if no actual change in patient)
+            leaving = self.filtered(
+                lambda lot: lot.is_insulin_pump
+                and lot.assigned_patient_id
+                and lot.assigned_patient_id.id != new_patient_id
+            )
+            if leaving:
+                # Set replacement date on old assignment logs
+                open_logs = leaving._get_open_assignment_logs()
+                old_logs = AssignmentLog.browse([
+                    log.id for (patient_id, lot_id, assignment_type), log in open_logs.items()
+                    if patient_id == self.browse(lot_id).assigned_patient_id.id
+                ])
+                if old_logs:
+                    old_logs.write({'replacement_date': fields.Date.today()})
                 
-                # Skip if no actual change in patient
-                if old_patient and old_patient.id == new_patient_id:
-                    continue
+                # Unlink from patients' device fields
+                leaving._unlink_from_patients()
                 
-                # Unassign from old patient if there was one
-                if old_patient and old_patient.id != new_patient_id:
-                    # Set replacement date on old assignment log
-                    old_log = self.env['insulin.assignment.log'].search([
-                        ('patient_id', '=', old_patient.id),
-                        ('equipment_id', '=', record.id),
-                        ('replacement_date', '=', False),
-                    ], limit=1)
-                    if old_log:
-                        old_log.replacement_date = fields.Date.today()
-                    
-                    # Unlink from patient's device fields
-                    if record.assignment_type == 'primary' and old_patient.primary_device_id.id == record.id:
-                        old_patient.with_context(skip_device_sync=True).primary_device_id = False
-                    elif record.assignment_type == 'holiday_pump' and old_patient.holiday_pump_id.id == record.id:
-                        old_patient.with_context(skip_device_sync=True).holiday_pump_id = False
-                    
-                    # Post note to old patient
-                    old_patient.message_post(body=f"Device SN {record.name} unassigned.")
+                # Queue notes to old patients
+                if not self.env.context.get('skip_assignment_notes'):
+                    patient_notes = defaultdict(list)
+                    for lot in leaving:
+                        patient_notes[lot.assigned_patient_id.id].append(f"Device SN {lot.name} unassigned.")
+                    ChatterBuffer._add_notes(leaving.assigned_patient_id, patient_notes)
                 
                 # Mark activities as done if unassigning or changing patient
-                if old_patient and old_patient.id != new_patient_id:
-                    record._mark_replacement_alerts_done()
+                leaving._mark_replacement_alerts_done()
         
-        result = super().write(vals)
+        result = self._write_and_count(vals)
         
         # Handle new patient assignment after the write
         if 'assigned_patient_id' in vals:
-            for record in self:
-                if not record.is_insulin_pump:
+            assigned = self.filtered(lambda lot: lot.is_insulin_pump and lot.assigned_patient_id)
+            open_logs = assigned._get_open_assignment_logs()
+            
+            # Create the missing assignment logs in one batch
+            log_vals_list = []
+            newly_assigned = self.browse()
+            for lot in assigned:
+                patient = lot.assigned_patient_id
+                assignment_type = lot.assignment_type or 'primary'
+                if (patient.id, lot.id, assignment_type) in open_logs:
                     continue
+                log_vals_list.append({
+                    'patient_id': patient.id,
+                    'equipment_id': lot.id,
+                    'assignment_type': assignment_type,
+                    'installation_date': lot.installation_date or patient.installation_date or fields.Date.today(),
+                })
+                newly_assigned |= lot
+            if log_vals_list:
+                AssignmentLog.create(log_vals_list)
+            
+            if newly_assigned:
+                # Update patients' device fields (with context to prevent recursion)
+                newly_assigned._link_to_patients()
                 
-                if record.assigned_patient_id:
-                    new_patient = record.assigned_patient_id
-                    assignment_type = record.assignment_type or 'primary'
-                    
-                    # Check if assignment log already exists for this patient and device
-                    existing_log = self.env['insulin.assignment.log'].search([
-                        ('patient_id', '=', new_patient.id),
-                        ('equipment_id', '=', record.id),
-                        ('assignment_type', '=', assignment_type),
-                        ('replacement_date', '=', False),
-                    ], limit=1)
-                    
-                    if not existing_log:
-                        # Create new assignment log
-                        installation_date = record.installation_date or new_patient.installation_date or fields.Date.today()
-                        self.env['insulin.assignment.log'].create({
-                            'patient_id': new_patient.id,
-                            'equipment_id': record.id,
-                            'assignment_type': assignment_type,
-                            'installation_date': installation_date,
-                        })
-                    
-                        # Update patient's device fields (with context to prevent recursion)
-                        if assignment_type == 'primary' and new_patient.primary_device_id.id != record.id:
-                            new_patient.with_context(skip_device_sync=True).primary_device_id = record.id
-                        elif assignment_type == 'holiday_pump' and new_patient.holiday_pump_id.id != record.id:
-                            new_patient.with_context(skip_device_sync=True).holiday_pump_id = record.id
-                        
-                        # Post note to new patient
-                        new_patient.message_post(body=f"Device SN {record.name} assigned as {assignment_type}.")
-                    
-                    # Set pump state to assigned if not already
-                    if record.pump_state != 'assigned':
-                        record.with_context(skip_assignment_sync=True).pump_state = 'assigned'
+                # Queue notes to new patients
+                if not self.env.context.get('skip_assignment_notes'):
+                    patient_notes = defaultdict(list)
+                    for lot in newly_assigned:
+                        assignment_type = lot.assignment_type or 'primary'
+                        patient_notes[lot.assigned_patient_id.id].append(
+                            f"Device SN {lot.name} assigned as {assignment_type}."
+                        )
+                    ChatterBuffer._add_notes(newly_assigned.assigned_patient_id, patient_notes)
+            
+            # Set pump state to assigned if not already
+            to_mark_assigned = assigned.filtered(lambda lot: lot.pump_state != 'assigned')
+            if to_mark_assigned:
+                to_mark_assigned.with_context(skip_assignment_sync=True).write({'pump_state': 'assigned'})
         
         return result
 
-    def action_unassign_device(self):
-        """Unassign the device from the patient."""
+    def init(self):
+        super().init()
+        # Serial lookups from the public form only ever target insulin pumps
+        create_index(
+            self.env.cr,
+            'stock_lot_insulin_pump_serial_normalized_index',
+            self._table,
+            ['serial_normalized'],
+            where='is_insulin_pump',
+        )
+        # Overdue holiday pump checks only look at holiday pumps on loan
+        create_index(
+            self.env.cr,
+            'stock_lot_assigned_holiday_pump_index',
+            self._table,
+            ['assigned_patient_id'],
+            where="pump_state = 'assigned' AND assignment_type = 'holiday_pump'",
+        )
+        # A patient has at most one assigned device per assignment type
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(SQL(
+                    """
+                    CREATE UNIQUE INDEX IF NOT EXISTS %s
+                        ON stock_lot (assigned_patient_id, assignment_type)
+                     WHERE pump_state = 'assigned' AND is_insulin_pump
+                    """,
+                    SQL.identifier(SINGLE_DEVICE_INDEX),
+                ))
+        except UniqueViolation:
+            _logger.warning(
+                "Could not create %s: some patients have several assigned devices of the same type; "
+                "assignments are checked without it until the duplicates are resolved",
+                SINGLE_DEVICE_INDEX,
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lots = super().create(vals_list)
+        Counter = self.env['insulin.device.status.counter']
+        Counter._apply_deltas({}, Counter._get_lot_keys(lots))
+        if any(lots.mapped('is_insulin_pump')):
+            self.env['insulin.replacement.demand']._invalidate_demand()
+        return lots
+
+    def unlink(self):
+        Counter = self.env['insulin.device.status.counter']
+        before = Counter._get_lot_keys(self)
+        has_pumps = any(self.mapped('is_insulin_pump'))
+        result = super().unlink()
+        Counter._apply_deltas(before, {})
+        if has_pumps:
+            self.env['insulin.replacement.demand']._invalidate_demand()
+        return result
+
+    def _write_and_count(self, vals):
+        """Run the parent write, applying device status counter deltas.
+
+        Only the parent write is wrapped, so nested writes issued by the
+        assignment sync are counted once, by their own call. Serial changes
+        are copied to the assignment logs and the cached replacement demand
+        is dropped here as well.
+        """
+        if not {'pump_state', 'product_id'} & vals.keys():
+            result = super(StockLot, self).write(vals)
+        else:
+            Counter = self.env['insulin.device.status.counter']
+            before = Counter._get_lot_keys(self)
+            result = super(StockLot, self).write(vals)
+            Counter._apply_deltas(before, Counter._get_lot_keys(self))
+        if 'name' in vals:
+            self._propagate_serial()
+        if DEMAND_LOT_FIELDS & vals.keys():
+            self.env['insulin.replacement.demand']._invalidate_demand()
+        return result
+
+    def _propagate_serial(self):
+        """Copy the serial of these lots to their assignment logs in one UPDATE.
+
+        Only logs whose copy differs are rewritten.
+        """
+        self.flush_recordset(['name'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE insulin_assignment_log log
+               SET equipment_serial = lot.name
+              FROM stock_lot lot
+             WHERE lot.id = log.equipment_id
+               AND lot.id IN %s
+               AND log.equipment_serial IS DISTINCT FROM lot.name
+            """,
+            tuple(self.ids),
+        ))
+        if self.env.cr.rowcount:
+            self.env['insulin.assignment.log'].invalidate_model(['equipment_serial'])
+
+    @api.model
+    def _find_pumps_by_serials(self, serials):
+        """Resolve serial numbers to insulin pump lots in a single query.
+
+        Matching is case-insensitive and ignores surrounding whitespace. When
+        several pumps share a serial, the one currently assigned wins.
+
+        :param serials: iterable of serial number strings
+        :return: dict mapping upper-cased serials to ``stock.lot`` records
+        """
+        serials = {serial.strip().upper() for serial in serials if serial and serial.strip()}
+        if not serials:
+            return {}
+        lots = self.search([
+            ('serial_normalized', 'in', list(serials)),
+            ('is_insulin_pump', '=', True),
+        ])
+        lots_by_serial = {}
+        for lot in lots:
+            current = lots_by_serial.get(lot.serial_normalized)
+            if not current or (current.pump_state != 'assigned' and lot.pump_state == 'assigned'):
+                lots_by_serial[lot.serial_normalized] = lot
+        return lots_by_serial
+
+    def _get_open_assignment_logs(self):
+        """Return the open assignment logs of these devices.
+
+        Logs are reached through ``current_assignment_log_id``, so this
+        reads them by primary key instead of searching the log table.
+
+        :return: dict mapping ``(patient_id, equipment_id, assignment_type)``
+            to the matching open ``insulin.assignment.log`` record
+        """
+        return {
+            (lot.current_assignment_log_id.patient_id.id, lot.id, lot.current_assignment_log_id.assignment_type):
+                lot.current_assignment_log_id
+            for lot in self if lot.current_assignment_log_id
+        }
+
+    def _unlink_from_patients(self):
+        """Clear the patient device fields still pointing at these devices.
+
+        Patients are grouped per device field so each field is cleared with
+        a single write.
+        """
+        Partner = self.env['res.partner']
+        primary_patients = Partner
+        holiday_patients = Partner
         for lot in self:
-            if lot.pump_state != 'assigned' or not lot.assigned_patient_id:
-                continue
-            
             patient = lot.assigned_patient_id
-            assignment_type = lot.assignment_type
-            sn = lot.name
-            patient_id = patient.patient_internal_id
-
-            # 1. Unlink from patient
-            if assignment_type == 'primary':
-                patient.primary_device_id = False
-            elif assignment_type == 'holiday_pump':
-                patient.holiday_pump_id = False
-
-            # 2. Transfer back to return location (Logic to be implemented or simplified for now)
-            # For now, we just set the state. The spec mentions "Transfer back to return location".
-            # This usually involves creating a stock.picking or stock.move.
-            # I'll check if there's a return location configured.
-            
-            # 3. Leave notes in chatter
-            patient_msg = f"Device SN {sn} unassigned." if assignment_type == 'primary' else f"Holiday Pump SN {sn} unassigned."
-            patient.message_post(body=patient_msg)
-            
-            lot_msg = f"Patient ID {patient_id} unassigned" if assignment_type == 'primary' else f"Patient ID {patient_id} unassigned (holiday pump)"
-            lot.message_post(body=lot_msg)
-
-            # 4. Set equipment State to 'available'
-            lot.write({
-                'pump_state': 'available',
-                'assigned_patient_id': False,
-                'assignment_type': False,
-            })
+            if lot.assignment_type == 'primary' and patient.primary_device_id == lot:
+                primary_patients |= patient
+            elif lot.assignment_type == 'holiday_pump' and patient.holiday_pump_id == lot:
+                holiday_patients |= patient
+        if primary_patients:
+            primary_patients.with_context(skip_device_sync=True).write({'primary_device_id': False})
+        if holiday_patients:
+            holiday_patients.with_context(skip_device_sync=True).write({'holiday_pump_id': False})
 
-    def action_scrap_device(self):
-        """Scrap the device."""
+    def _link_to_patients(self):
+        """Point each assigned patient's device field at its device.
+
+        Patients are grouped by (field, device) so that identical updates
+        share a single write.
+        """
+        updates = defaultdict(lambda: self.env['res.partner'])
         for lot in self:
             patient = lot.assigned_patient_id
-            sn = lot.name
-
-            # 1. Unlink from patient
-            if patient:
-                if lot.assignment_type == 'primary':
-                    patient.primary_device_id = False
-                elif lot.assignment_type == 'holiday_pump':
-                    patient.holiday_pump_id = False
-                
-                # 3. Leave note in patient
-                patient.message_post(body=f"Device SN {sn} scrapped")
+            assignment_type = lot.assignment_type or 'primary'
+            if assignment_type == 'primary' and patient.primary_device_id != lot:
+                updates['primary_device_id', lot.id] |= patient
+            elif assignment_type == 'holiday_pump' and patient.holiday_pump_id != lot:
+                updates['holiday_pump_id', lot.id] |= patient
+        for (field_name, lot_id), patients in updates.items():
+            patients.with_context(skip_device_sync=True).write({field_name: lot_id})
 
-            # 2. Move equipment to Scrap location (Logic to be implemented)
-            
-            # 4. Set equipment State to 'scrapped'
-            lot.write({
-                'pump_state': 'scrapped',
-                'assigned_patient_id': False,
-                'assignment_type': False,
-            })
+    def action_unassign_device(self):
+        """Unassign the devices from their patients.
+
+        Selections larger than ``insulin_pumps.bulk_job_threshold`` are queued
+        as a background job so the request returns right away.
+        """
+        lots = self.filtered(lambda lot: lot.pump_state == 'assigned' and lot.assigned_patient_id)
+        if len(lots) > self._get_bulk_job_threshold():
+            return self.env['insulin.device.bulk.job']._enqueue('unassign', lots)
+        lots._bulk_unassign_devices()
+
+    def action_scrap_device(self):
+        """Scrap the devices.
+
+        Selections larger than ``insulin_pumps.bulk_job_threshold`` are queued
+        as a background job so the request returns right away.
+        """
+        lots = self.filtered(lambda lot: lot.pump_state != 'scrapped')
+        if len(lots) > self._get_bulk_job_threshold():
+            return self.env['insulin.device.bulk.job']._enqueue('scrap', lots)
+        lots._bulk_scrap_devices()
+
+    @api.model
+    def _get_bulk_job_threshold(self):
+        """Number of devices above which bulk actions run in the background."""
+        return self.env['insulin.pumps.settings']._get('bulk_job_threshold')
+
+    def _bulk_unassign_devices(self):
+        """Unassign these devices with set-based writes and batched chatter notes."""
+        lots = self.filtered(lambda lot: lot.pump_state == 'assigned' and lot.assigned_patient_id)
+        if not lots:
+            return
+        
+        patient_notes = defaultdict(list)
+        lot_notes = {}
+        for lot in lots:
+            patient_id = lot.assigned_patient_id.patient_internal_id
+            if lot.assignment_type == 'primary':
+                patient_notes[lot.assigned_patient_id.id].append(f"Device SN {lot.name} unassigned.")
+                lot_notes[lot.id] = [f"Patient ID {patient_id} unassigned"]
+            else:
+                patient_notes[lot.assigned_patient_id.id].append(f"Holiday Pump SN {lot.name} unassigned.")
+                lot_notes[lot.id] = [f"Patient ID {patient_id} unassigned (holiday pump)"]
+        patients = lots.assigned_patient_id
+        
+        # 1. Unlink from patients, close assignment logs and
+        # 4. set equipment State to 'available', all in one write
+        lots.with_context(skip_assignment_notes=True).write({
+            'pump_state': 'available',
+            'assigned_patient_id': False,
+            'assignment_type': False,
+        })
+        
+        # 2. Transfer back to return location
+        self.env['insulin.device.movement']._move_to_return_location(lots)
+        
+        # 3. Leave notes in chatter
+        ChatterBuffer = self.env['insulin.chatter.buffer']
+        ChatterBuffer._add_notes(patients, patient_notes)
+        ChatterBuffer._add_notes(lots, lot_notes)
+
+    def _bulk_scrap_devices(self):
+        """Scrap these devices with set-based writes and batched chatter notes."""
+        lots = self.filtered(lambda lot: lot.pump_state != 'scrapped')
+        if not lots:
+            return
+        
+        patient_notes = defaultdict(list)
+        for lot in lots.filtered('assigned_patient_id'):
+            patient_notes[lot.assigned_patient_id.id].append(f"Device SN {lot.name} scrapped")
+        patients = lots.assigned_patient_id
+        
+        # 1. Unlink from patients and 4. set equipment State to 'scrapped'
+        lots.with_context(skip_assignment_notes=True).write({
+            'pump_state': 'scrapped',
+            'assigned_patient_id': False,
+            'assignment_type': False,
+        })
+        
+        # 2. Move equipment to Scrap location
+        self.env['insulin.device.movement']._move_to_scrap_location(lots)
+        
+        # 3. Leave notes in patients' chatter
+        self.env['insulin.chatter.buffer']._add_notes(patients, patient_notes)
 
     def action_replace_device_wizard(self):
         """Open the Replace Device Modal.
@@ -253,6 +508,41 @@ class StockLot(models.Model):
             'context': {'default_old_device_id': self.id},
         }
 
+    @api.depends('assigned_patient_id')
+    def _compute_patient_internal_id(self):
+        for lot in self:
+            lot.patient_internal_id = lot.assigned_patient_id.patient_internal_id
+
+    @api.depends('name')
+    def _compute_serial_normalized(self):
+        for lot in self:
+            lot.serial_normalized = (lot.name or '').strip().upper() or False
+
+    @api.depends('assignment_type', 'assignment_log_ids.assignment_type', 'assignment_log_ids.replacement_date')
+    def _compute_current_assignment_log_id(self):
+        """Point each device at its open log, found through the open log index."""
+        logs = self.env['insulin.assignment.log'].search([
+            ('equipment_id', 'in', self._origin.ids),
+            ('replacement_date', '=', False),
+        ])
+        open_logs = {(log.equipment_id.id, log.assignment_type): log for log in logs}
+        for lot in self:
+            lot.current_assignment_log_id = open_logs.get((lot._origin.id, lot.assignment_type or 'primary'))
+
+    @api.depends('assignment_log_ids', 'assignment_log_ids.installation_date')
+    def _compute_assignment_stats(self):
+        """Count assignment logs per device with one grouped query."""
+        stats = {
+            lot.id: (count, first_date)
+            for lot, count, first_date in self.env['insulin.assignment.log']._read_group(
+                [('equipment_id', 'in', self.ids)],
+                ['equipment_id'],
+                ['__count', 'installation_date:min'],
+            )
+        }
+        for lot in self:
+            lot.assignment_count, lot.first_assignment_date = stats.get(lot.id, (0, False))
+
     @api.depends('installation_date', 'lifespan_years')
     def _compute_replacement_date(self):
         """Calculate replacement date based on installation date and lifespan."""
@@ -273,9 +563,7 @@ class StockLot(models.Model):
     def _compute_replacement_alert(self):
         """Check if the replacement date is within the configured alert threshold."""
         today = fields.Date.today()
-        alert_days = int(self.env['ir.config_parameter'].sudo().get_param(
-            'insulin_pumps.replacement_alert_days', default='30'
-        ))
+        alert_days = self.env['insulin.pumps.settings']._get('replacement_alert_days')
         alert_threshold = today + timedelta(days=alert_days)
         for record in self:
             if record.replacement_date and record.replacement_date <= alert_threshold:
@@ -283,6 +571,62 @@ class StockLot(models.Model):
             else:
                 record.replacement_alert = False
 
+    @api.model
+    def _refresh_replacement_alerts(self):
+        """Bring the stored replacement_alert flag in line with today's threshold.
+
+        The flag is only recomputed when replacement_date changes, so it goes
+        stale as days pass. The alert window only ever moves by the distance
+        between the threshold used on the previous refresh and today's one,
+        so only lots whose replacement_date falls between those two dates can
+        have changed. They are fixed with a single UPDATE over the indexed
+        replacement_date column instead of a fleet-wide recompute.
+        """
+        IrConfigParameter = self.env['ir.config_parameter'].sudo()
+        alert_days = self.env['insulin.pumps.settings']._get('replacement_alert_days')
+        threshold = fields.Date.today() + timedelta(days=alert_days)
+        previous_threshold = fields.Date.to_date(IrConfigParameter.get_param(
+            'insulin_pumps.replacement_alert_threshold'
+        ))
+        
+        self.flush_model(['replacement_date', 'replacement_alert'])
+        if previous_threshold:
+            if previous_threshold == threshold:
+                return
+            window = SQL(
+                "replacement_date > %s AND replacement_date <= %s",
+                min(previous_threshold, threshold), max(previous_threshold, threshold),
+            )
+        else:
+            # First run: there is no known window yet, check every lot once
+            window = SQL("TRUE")
+        
+        self.env.cr.execute(SQL(
+            """
+            UPDATE stock_lot
+               SET replacement_alert = COALESCE(replacement_date <= %(threshold)s, FALSE)
+             WHERE %(window)s
+               AND replacement_alert IS DISTINCT FROM COALESCE(replacement_date <= %(threshold)s, FALSE)
+            RETURNING id
+            """,
+            threshold=threshold,
+            window=window,
+        ))
+        updated_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model(['replacement_alert'])
+        IrConfigParameter.set_param(
+            'insulin_pumps.replacement_alert_threshold', fields.Date.to_string(threshold)
+        )
+        _logger.info(
+            "Replacement alerts refreshed up to %s: %d lots updated", threshold, len(updated_ids)
+        )
+        return updated_ids
+
+    @api.model
+    def _cron_refresh_replacement_alerts(self):
+        """Scheduled action to keep replacement_alert correct as days pass."""
+        self._refresh_replacement_alerts()
+
     @api.depends('product_id', 'product_id.product_tmpl_id.is_insulin_pump_product')
     def _compute_is_insulin_pump(self):
         """Check if this lot belongs to an insulin pump product."""
@@ -303,27 +647,55 @@ class StockLot(models.Model):
 
     @api.constrains('assigned_patient_id', 'assignment_type', 'pump_state')
     def _check_single_device_per_type(self):
-        """Ensure a patient cannot have more than one device of each type assigned."""
-        for lot in self:
-            if not lot.is_insulin_pump or lot.pump_state != 'assigned':
+        """Ensure a patient cannot have more than one device of each type assigned.
+
+        The rule is enforced by the partial unique index
+        ``stock_lot_single_device_per_type_index``, which also covers
+        concurrent writers. Flushing the pending assignment values is
+        therefore enough to check them; the grouped query below only runs to
+        build the error message once the index reports a violation. Databases
+        where the index could not be created, because of existing duplicate
+        assignments, are checked with the grouped query alone.
+        """
+        has_index = index_exists(self.env.cr, SINGLE_DEVICE_INDEX)
+        if has_index:
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self.flush_model(['assigned_patient_id', 'assignment_type', 'pump_state'])
+            except UniqueViolation as e:
+                if e.diag.constraint_name != SINGLE_DEVICE_INDEX:
+                    raise
+            else:
+                return
+        
+        lots = self.filtered(
+            lambda lot: lot.is_insulin_pump and lot.pump_state == 'assigned'
+            and lot.assigned_patient_id and lot.assignment_type
+        )
+        # Devices of the batch, plus other assigned devices of the same patients
+        others = self.search([
+            ('id', 'not in', lots.ids),
+            ('assigned_patient_id', 'in', lots.assigned_patient_id.ids),
+            ('pump_state', '=', 'assigned'),
+            ('is_insulin_pump', '=', True),
+        ])
+        seen = {}
+        for lot in others + lots:
+            key = (lot.assigned_patient_id.id, lot.assignment_type)
+            if key not in seen:
+                seen[key] = lot
                 continue
-            if not lot.assigned_patient_id or not lot.assignment_type:
+            if lot in others:
                 continue
-            
-            # Check for other assigned devices of the same type for this patient
-            other_devices = self.search([
-                ('id', '!=', lot.id),
-                ('assigned_patient_id', '=', lot.assigned_patient_id.id),
-                ('assignment_type', '=', lot.assignment_type),
-                ('pump_state', '=', 'assigned'),
-            ])
-            
-            if other_devices:
-                device_type_label = 'Primary' if lot.assignment_type == 'primary' else 'Holiday Pump'
-                raise ValidationError(
-                    f"Patient {lot.assigned_patient_id.name} already has an assigned {device_type_label} device "
-                    f"({other_devices[0].name}). A patient can only have one {device_type_label} device at a time."
-                )
+            device_type_label = 'Primary' if lot.assignment_type == 'primary' else 'Holiday Pump'
+            raise ValidationError(
+                f"Patient {lot.assigned_patient_id.name} already has an assigned {device_type_label} device "
+                f"({seen[key].name}). A patient can only have one {device_type_label} device at a time."
+            )
+        if has_index:
+            raise ValidationError(
+                "A patient can only have one Primary device and one Holiday Pump device at a time."
+            )
 
     @api.constrains('is_rma_device', 'assigned_patient_id', 'assignment_type', 'pump_state')
     def _check_rma_device_constraints(self):
@@ -354,13 +726,9 @@ class StockLot(models.Model):
             # If we get here without that context for a primary assignment,
             # it means someone is trying to assign an RMA device directly
             if lot.assignment_type == 'primary' and lot.assigned_patient_id:
-                # Check if this device has never been assigned before (initial assignment)
-                assignment_count = self.env['insulin.assignment.log'].search_count([
-                    ('equipment_id', '=', lot.id),
-                ])
                 # If there are no assignment logs yet, this is an initial assignment
                 # which is not allowed for RMA devices
-                if assignment_count == 0:
+                if not lot.assignment_count:
                     raise ValidationError(
                         f"RMA device '{lot.name}' cannot be assigned as an initial primary device. "
                         "RMA devices can only be used as replacements for malfunctioning primary devices "
@@ -390,18 +758,32 @@ class StockLot(models.Model):
         - Assigned to a patient
         - Have a replacement date set
         - Replacement date is within the configured alert threshold
+
+        Existing alert activities are fetched in a single query for all
+        candidate devices, and new activities are created in batches of
+        ``insulin_pumps.cron_batch_size`` records, committing after each
+        batch so a failure does not roll back the work already done.
         """
-        # Get alert threshold from settings (default 30 days)
-        IrConfigParameter = self.env['ir.config_parameter'].sudo()
-        alert_days = int(IrConfigParameter.get_param(
-            'insulin_pumps.replacement_alert_days', default='30'
-        ))
+        started = time.monotonic()
+
+        # Get alert threshold and batch size from settings
+        settings = self.env['insulin.pumps.settings']._get_settings()
+        alert_days = settings['replacement_alert_days']
+        batch_size = settings['cron_batch_size'] or 1000
+        
+        activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
+        if not activity_type:
+            return
         
         # Get Patient Administrators group for activity assignment
         admin_group = self.env.ref(
             'insulin_pumps_evercare.group_patient_administrators', 
             raise_if_not_found=False
         )
+        user_id = self.env.user.id
+        if admin_group and admin_group.users:
+            user_id = admin_group.users[0].id
+        res_model_id = self.env['ir.model']._get_id('stock.lot')
         
         # Calculate the date threshold
         today = fields.Date.today()
@@ -414,53 +796,220 @@ class StockLot(models.Model):
             ('replacement_date', '!=', False),
             ('replacement_date', '<=', threshold_date),
             ('replacement_date', '>=', today),  # Not already past
-        ])
+        ], order='id')
+        
+        # Fetch the devices that already have an open alert in one query
+        existing_activities = self.env['mail.activity'].search_read([
+            ('res_model', '=', 'stock.lot'),
+            ('res_id', 'in', devices.ids),
+            ('activity_type_id', '=', activity_type.id),
+            ('summary', 'ilike', 'Replacement date approaching'),
+        ], ['res_id'])
+        alerted_ids = {activity['res_id'] for activity in existing_activities}
+        devices_to_alert = devices.filtered(lambda device: device.id not in alerted_ids)
+        
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        created_count = 0
+        for offset in range(0, len(devices_to_alert), batch_size):
+            batch = devices_to_alert[offset:offset + batch_size]
+            vals_list = []
+            for device in batch:
+                # Calculate days remaining
+                days_remaining = (device.replacement_date - today).days
+                
+                # Build activity note
+                patient_name = device.assigned_patient_id.name or 'Unknown'
+                patient_id = device.assigned_patient_id.patient_internal_id or 'N/A'
+                assignment_type = 'Primary' if device.assignment_type == 'primary' else 'Holiday Pump'
+                
+                note = (
+                    f"<p><strong>Equipment SN:</strong> {device.name}</p>"
+                    f"<p><strong>Patient:</strong> {patient_name} ({patient_id})</p>"
+                    f"<p><strong>Assignment Type:</strong> {assignment_type}</p>"
+                    f"<p><strong>Replacement Date:</strong> {device.replacement_date}</p>"
+                    f"<p><strong>Days Remaining:</strong> {days_remaining}</p>"
+                )
+                
+                vals_list.append({
+                    'res_model_id': res_model_id,
+                    'res_id': device.id,
+                    'activity_type_id': activity_type.id,
+                    'summary': f'Replacement date approaching: {device.name}',
+                    'note': note,
+                    'date_deadline': device.replacement_date,
+                    'user_id': user_id,
+                })
+            
+            self.env['mail.activity'].create(vals_list)
+            created_count += len(vals_list)
+            if auto_commit:
+                self.env.cr.commit()
+        
+        _logger.info(
+            "Replacement date alerts: %d candidate devices, %d already alerted, "
+            "%d activities created in %.2fs",
+            len(devices), len(alerted_ids), created_count, time.monotonic() - started,
+        )
+
+    @api.model
+    def _find_overdue_holiday_pumps(self, today=None):
+        """Find the holiday pumps on loan past their due date in one query.
+
+        The due date is the patient's holiday pump return date or, when it
+        is not set, the travel end date of the approved request the pump
+        was lent for. The scan is driven by the partial index on assigned
+        holiday pumps, so its cost follows the number of pumps on loan.
+
+        :return: list of ``(lot_id, patient_id, due_date, at_return_location)``
+            tuples, where ``at_return_location`` tells whether the pump has
+            already been checked in at the configured return location
+        """
+        today = today or fields.Date.today()
+        return_location = self.env['insulin.device.movement']._get_return_location()
+        if return_location:
+            self.env['stock.quant'].flush_model(['lot_id', 'location_id', 'quantity'])
+            at_return_location = SQL(
+                """
+                EXISTS (
+                    SELECT 1
+                      FROM stock_quant q
+                      JOIN stock_location loc ON loc.id = q.location_id
+                     WHERE q.lot_id = l.id
+                       AND q.quantity > 0
+                       AND loc.parent_path LIKE %s
+                )
+                """,
+                f'{return_location.parent_path}%',
+            )
+        else:
+            at_return_location = SQL("FALSE")
+        
+        self.flush_model(['assigned_patient_id', 'assignment_type', 'pump_state', 'is_insulin_pump'])
+        self.env['res.partner'].flush_model(['holiday_pump_return_date'])
+        self.env['insulin.holiday.pump.request'].flush_model(['holiday_pump_id', 'patient_id', 'status',
+                                                              'travel_end_date'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT l.id, l.assigned_patient_id, due.due_date, %(at_return_location)s
+              FROM stock_lot l
+              JOIN res_partner p ON p.id = l.assigned_patient_id
+             CROSS JOIN LATERAL (
+                    SELECT COALESCE(p.holiday_pump_return_date, MAX(request.travel_end_date)) AS due_date
+                      FROM insulin_holiday_pump_request request
+                     WHERE request.holiday_pump_id = l.id
+                       AND request.patient_id = p.id
+                       AND request.status = 'approved'
+                   ) due
+             WHERE l.pump_state = 'assigned'
+               AND l.assignment_type = 'holiday_pump'
+               AND l.is_insulin_pump
+               AND due.due_date < %(today)s
+          ORDER BY l.id
+            """,
+            at_return_location=at_return_location,
+            today=today,
+        ))
+        return self.env.cr.fetchall()
+
+    def _auto_return_holiday_pumps(self):
+        """Unassign holiday pumps already checked in at the return location.
+
+        All pumps are released with one batched write, their patients' return
+        dates are cleared with a second one and the chatter notes are logged
+        in bulk.
+        """
+        lots = self.filtered(lambda lot: lot.pump_state == 'assigned' and lot.assignment_type == 'holiday_pump')
+        if not lots:
+            return
+        patient_notes = defaultdict(list)
+        lot_notes = {}
+        for lot in lots:
+            patient_notes[lot.assigned_patient_id.id].append(
+                f"Overdue Holiday Pump SN {lot.name} returned and unassigned."
+            )
+            lot_notes[lot.id] = [
+                f"Patient ID {lot.assigned_patient_id.patient_internal_id} unassigned (holiday pump returned)"
+            ]
+        patients = lots.assigned_patient_id
+        
+        lots.with_context(skip_assignment_notes=True).write({
+            'pump_state': 'available',
+            'assigned_patient_id': False,
+            'assignment_type': False,
+        })
+        patients.with_context(skip_device_sync=True).write({'holiday_pump_return_date': False})
+        
+        ChatterBuffer = self.env['insulin.chatter.buffer']
+        ChatterBuffer._add_notes(patients, patient_notes)
+        ChatterBuffer._add_notes(lots, lot_notes)
+
+    @api.model
+    def _cron_check_overdue_holiday_pumps(self):
+        """Scheduled action flagging holiday pumps not returned on time.
+
+        Overdue pumps are found in one query. When auto-return is enabled,
+        those already checked in at the return location are unassigned in
+        bulk. For the others, one activity per patient lists all of the
+        patient's overdue pumps. Activities of patients that are no longer
+        overdue are marked as done.
+        """
+        started = time.monotonic()
+        today = fields.Date.today()
+        overdue = self._find_overdue_holiday_pumps(today)
+        
+        returned = self.browse()
+        if self.env['insulin.pumps.settings']._get('auto_return_holiday_pumps'):
+            returned = self.browse([lot_id for lot_id, _patient_id, _due_date, at_return in overdue if at_return])
+            returned._auto_return_holiday_pumps()
+        
+        returned_ids = set(returned.ids)
+        overdue_by_patient = defaultdict(list)
+        for lot_id, patient_id, due_date, _at_return in overdue:
+            if lot_id not in returned_ids:
+                overdue_by_patient[patient_id].append((self.browse(lot_id), due_date))
         
         activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
         if not activity_type:
             return
+        admin_group = self.env.ref(
+            'insulin_pumps_evercare.group_patient_administrators',
+            raise_if_not_found=False
+        )
+        user_id = self.env.user.id
+        if admin_group and admin_group.users:
+            user_id = admin_group.users[0].id
         
-        for device in devices:
-            # Check if an activity already exists for this device
-            existing_activity = self.env['mail.activity'].search([
-                ('res_model', '=', 'stock.lot'),
-                ('res_id', '=', device.id),
-                ('activity_type_id', '=', activity_type.id),
-                ('summary', 'ilike', 'Replacement date approaching'),
-            ], limit=1)
-            
-            if existing_activity:
+        # Open overdue activities, fetched in one query
+        activities = self.env['mail.activity'].search([
+            ('res_model', '=', 'res.partner'),
+            ('activity_type_id', '=', activity_type.id),
+            ('summary', '=like', 'Holiday pump overdue%'),
+        ])
+        activities.filtered(lambda activity: activity.res_id not in overdue_by_patient).action_done()
+        alerted_ids = set(activities.mapped('res_id'))
+        
+        res_model_id = self.env['ir.model']._get_id('res.partner')
+        vals_list = []
+        for patient_id, pumps in overdue_by_patient.items():
+            if patient_id in alerted_ids:
                 continue
-            
-            # Calculate days remaining
-            days_remaining = (device.replacement_date - today).days
-            
-            # Build activity note
-            patient_name = device.assigned_patient_id.name or 'Unknown'
-            patient_id = device.assigned_patient_id.patient_internal_id or 'N/A'
-            assignment_type = 'Primary' if device.assignment_type == 'primary' else 'Holiday Pump'
-            
-            note = (
-                f"<p><strong>Equipment SN:</strong> {device.name}</p>"
-                f"<p><strong>Patient:</strong> {patient_name} ({patient_id})</p>"
-                f"<p><strong>Assignment Type:</strong> {assignment_type}</p>"
-                f"<p><strong>Replacement Date:</strong> {device.replacement_date}</p>"
-                f"<p><strong>Days Remaining:</strong> {days_remaining}</p>"
+            note = Markup('').join(
+                Markup("<p><strong>Holiday Pump SN:</strong> %s, due back on %s (%s days overdue)</p>")
+                % (lot.name, due_date, (today - due_date).days)
+                for lot, due_date in pumps
             )
-            
-            # Determine user to assign activity to
-            user_id = self.env.user.id
-            if admin_group and admin_group.users:
-                user_id = admin_group.users[0].id
-            
-            # Create activity
-            self.env['mail.activity'].create({
-                'res_model_id': self.env['ir.model']._get('stock.lot').id,
-                'res_id': device.id,
+            vals_list.append({
+                'res_model_id': res_model_id,
+                'res_id': patient_id,
                 'activity_type_id': activity_type.id,
-                'summary': f'Replacement date approaching: {device.name}',
+                'summary': f"Holiday pump overdue: {', '.join(lot.name for lot, _due_date in pumps)}",
                 'note': note,
-                'date_deadline': device.replacement_date,
+                'date_deadline': today,
                 'user_id': user_id,
             })
-
+        self.env['mail.activity'].create(vals_list)
+        
+        _logger.info(
+            "Overdue holiday pumps: %d overdue, %d auto-returned, %d activities created in %.2fs",
+            len(overdue), len(returned), len(vals_list), time.monotonic() - started,
+        )
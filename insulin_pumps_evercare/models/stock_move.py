@@ -0,0 +1,35 @@
+from odoo import fields, models
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists, create_column, create_index
+
+
+class StockMove(models.Model):
+    """Extend stock.move to mark moves applied to consumables allocations."""
+    _inherit = 'stock.move'
+
+    insulin_usage_applied = fields.Boolean(
+        string='Applied to Consumables Usage',
+        readonly=True,
+        copy=False,
+        help='Done consumable move already added to the patient\'s consumables usage'
+    )
+
+    def _auto_init(self):
+        if not column_exists(self.env.cr, self._table, 'insulin_usage_applied'):
+            create_column(self.env.cr, self._table, 'insulin_usage_applied', 'boolean')
+            # Usage done before the module was installed was entered by hand
+            self.env.cr.execute(SQL(
+                "UPDATE stock_move SET insulin_usage_applied = TRUE WHERE state = 'done'"
+            ))
+        return super()._auto_init()
+
+    def init(self):
+        super().init()
+        # The usage job looks up the pending done moves of consumable products
+        create_index(
+            self.env.cr,
+            'stock_move_insulin_usage_pending_index',
+            self._table,
+            ['product_id'],
+            where="state = 'done' AND insulin_usage_applied IS NOT TRUE",
+        )
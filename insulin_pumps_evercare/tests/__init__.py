@@ -0,0 +1,3 @@
+from . import test_write_amplification
+from . import test_benchmark_assignment
+from . import test_chatter_buffer
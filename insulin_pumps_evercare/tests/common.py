@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import TransactionCase
+
+_logger = logging.getLogger(__name__)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+
+# Number of records each scenario runs with; add the 50k run with
+# INSULIN_PUMPS_BENCHMARK_SIZES=10,1000,50000
+BENCHMARK_SIZES = [
+    int(size) for size in os.environ.get('INSULIN_PUMPS_BENCHMARK_SIZES', '10,1000').split(',')
+]
+# Allowed slowdown over the baseline duration, e.g. 1.5; durations depend on
+# the machine, so they are only checked when this is set
+TIME_TOLERANCE = float(os.environ.get('INSULIN_PUMPS_BENCHMARK_TIME_TOLERANCE') or 0)
+# File to record the measurements to instead of checking them, e.g.
+# INSULIN_PUMPS_BENCHMARK_OUTPUT=tests/benchmark_baselines.json; the source
+# tree is never written otherwise
+BASELINE_OUTPUT = os.environ.get('INSULIN_PUMPS_BENCHMARK_OUTPUT')
+
+IMPORT_COLUMNS = [
+    'name', 'installation_date', 'holiday_pump_return_date', 'primary_serial', 'holiday_serial',
+]
+
+
+class InsulinPumpsBenchmarkCase(TransactionCase):
+    """Base class for the insulin pumps benchmarks.
+
+    Provides a synthetic data generator and a harness measuring the query
+    count and duration of a block of code. Measurements are checked against
+    ``benchmark_baselines.json``: more queries than the baseline fail through
+    ``assertQueryCount``, and when ``TIME_TOLERANCE`` is set, a duration
+    above the baseline times that tolerance fails the run as well. Sizes
+    without a baseline are skipped. Independently of the baselines, the
+    queries per record of a scenario must not grow with its size. Run with
+    ``INSULIN_PUMPS_BENCHMARK_OUTPUT=<path>`` to record the measurements,
+    merged with the existing baselines, to that file instead.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.today = fields.Date.today()
+        cls.pump_product = cls.env.ref('insulin_pumps_evercare.product_template_tslim_x2').product_variant_id
+        cls.rma_product = cls.env.ref('insulin_pumps_evercare.product_template_tslim_x2_rma').product_variant_id
+        with open(BASELINE_PATH) as baseline_file:
+            cls.baselines = json.load(baseline_file)
+        cls.measurements = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if BASELINE_OUTPUT and cls.measurements:
+            baselines = cls.baselines
+            if os.path.exists(BASELINE_OUTPUT):
+                with open(BASELINE_OUTPUT) as baseline_file:
+                    baselines = json.load(baseline_file)
+            for scenario, results in cls.measurements.items():
+                baselines.setdefault(scenario, {}).update(results)
+            with open(BASELINE_OUTPUT, 'w') as baseline_file:
+                json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+                baseline_file.write('\n')
+        super().tearDownClass()
+
+    # ------------------------------------------------------------------
+    # Synthetic data
+    # ------------------------------------------------------------------
+
+    def _generate_lots(self, count, prefix, product=None, pump_type='primary'):
+        """Create ``count`` available insulin pumps."""
+        product = product or self.pump_product
+        return self.env['stock.lot'].create([{
+            'name': f'{prefix}-{i:06d}',
+            'product_id': product.id,
+            'pump_type': pump_type,
+        } for i in range(count)])
+
+    def _generate_patients(self, count, prefix, installation_date=None, holiday_return_date=None):
+        """Create ``count`` patients with a primary device each.
+
+        Goes through the bulk patient import, which creates the partners,
+        device assignments, logs and allocations in batches. With
+        ``holiday_return_date``, each patient also gets a holiday pump due
+        back on that date.
+
+        :return: the patients, in creation order
+        """
+        lots = self._generate_lots(count, f'{prefix}-P')
+        holiday_lots = (
+            self._generate_lots(count, f'{prefix}-H', pump_type='holiday')
+            if holiday_return_date else [False] * count
+        )
+        stream = io.StringIO(newline='')
+        writer = csv.DictWriter(stream, fieldnames=IMPORT_COLUMNS)
+        writer.writeheader()
+        for i, (lot, holiday_lot) in enumerate(zip(lots, holiday_lots)):
+            writer.writerow({
+                'name': f'{prefix} Patient {i:06d}',
+                'installation_date': installation_date or self.today,
+                'holiday_pump_return_date': holiday_return_date or '',
+                'primary_serial': lot.name,
+                'holiday_serial': holiday_lot.name if holiday_lot else '',
+            })
+        stream.seek(0)
+        imported_count, error_count = self.env['insulin.patient.import']._import_csv(
+            stream, chunk_size=5000, auto_commit=False
+        )
+        self.assertEqual((imported_count, error_count), (count, 0))
+        return lots.assigned_patient_id.sorted('id')
+
+    def _installation_date_due_in(self, days):
+        """Installation date giving a default-lifespan device a replacement in ``days`` days."""
+        lifespan = self.env['stock.lot']._fields['lifespan_years'].default(self.env['stock.lot'])
+        due = self.today + timedelta(days=days)
+        return due.replace(year=due.year - lifespan)
+
+    # ------------------------------------------------------------------
+    # Harness
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def benchmark(self, scenario, size):
+        """Measure the queries and time spent in the block against the baseline."""
+        baseline = None if BASELINE_OUTPUT else self.baselines.get(scenario, {}).get(str(size))
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        started = time.perf_counter()
+        with self.assertQueryCount(baseline['queries']) if baseline else nullcontext():
+            yield
+            # Work deferred to commit time, such as the chatter notes
+            self.env.cr.precommit.run()
+            self.env.flush_all()
+        elapsed = time.perf_counter() - started
+        queries = self.env.cr.sql_log_count - queries_before
+        self.measurements.setdefault(scenario, {})[str(size)] = {
+            'queries': queries,
+            'seconds': round(elapsed, 3),
+        }
+        _logger.info("Benchmark %s[%d]: %d queries in %.3fs", scenario, size, queries, elapsed)
+        if baseline and TIME_TOLERANCE:
+            self.assertLessEqual(
+                elapsed, baseline['seconds'] * TIME_TOLERANCE,
+                f"{scenario}[{size}] took {elapsed:.3f}s, baseline is {baseline['seconds']}s",
+            )
+
+    def run_sizes(self, scenario, prepare, run):
+        """Run a scenario at every benchmark size.
+
+        :param prepare: callable taking the size and a unique prefix, returning
+            the data passed to ``run``; not measured
+        :param run: callable taking the prepared data; measured
+        """
+        for size in BENCHMARK_SIZES:
+            with self.subTest(size=size):
+                data = prepare(size, f'{scenario.upper()}-{size}')
+                with self.benchmark(scenario, size):
+                    run(data)
+                self.env.invalidate_all()
+        sizes = sorted(self.measurements.get(scenario, {}), key=int)
+        for size in sizes[1:]:
+            # Per-record cost compared to the smallest size: N+1 patterns fail
+            # here even where no baseline was recorded yet
+            queries = self.measurements[scenario][size]['queries']
+            smallest = self.measurements[scenario][sizes[0]]['queries']
+            self.assertLessEqual(
+                queries * int(sizes[0]), smallest * int(size),
+                f"{scenario}: {queries} queries for {size} records, {smallest} for {sizes[0]}",
+            )
+        missing = [
+            size for size in BENCHMARK_SIZES
+            if str(size) not in self.baselines.get(scenario, {})
+        ]
+        if missing and not BASELINE_OUTPUT:
+            self.skipTest(
+                f"No baseline for {scenario} at sizes {missing}: record them with "
+                "INSULIN_PUMPS_BENCHMARK_OUTPUT=<path to benchmark_baselines.json>"
+            )
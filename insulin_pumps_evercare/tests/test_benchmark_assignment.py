@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from odoo.tests import tagged
+
+from .common import InsulinPumpsBenchmarkCase
+
+
+@tagged('post_install', '-at_install', '-standard', 'insulin_pumps_benchmark')
+class TestBenchmarkAssignment(InsulinPumpsBenchmarkCase):
+    """Query count and latency of the device assignment workflows.
+
+    Excluded from the standard test run; run with
+    ``--test-tags insulin_pumps_benchmark``.
+    """
+
+    def test_patient_create_with_devices(self):
+        def prepare(size, prefix):
+            return prefix, self._generate_lots(size, prefix)
+
+        def run(data):
+            prefix, lots = data
+            self.env['res.partner'].create([{
+                'name': f'{prefix} Patient {i:06d}',
+                'is_patient': True,
+                'installation_date': self.today,
+                'primary_device_id': lot.id,
+            } for i, lot in enumerate(lots)])
+
+        self.run_sizes('patient_create_with_devices', prepare, run)
+
+    def test_stock_lot_reassignment(self):
+        def prepare(size, prefix):
+            patients = self._generate_patients(size, prefix)
+            targets = self.env['res.partner'].create([{
+                'name': f'{prefix} Target {i:06d}',
+                'is_patient': True,
+            } for i in range(size)])
+            return list(zip(patients.primary_device_id, targets))
+
+        def run(pairs):
+            for lot, target in pairs:
+                lot.write({'assigned_patient_id': target.id})
+
+        self.run_sizes('stock_lot_reassignment', prepare, run)
+
+    def test_action_unassign_device(self):
+        def prepare(size, prefix):
+            return self._generate_patients(size, prefix).primary_device_id
+
+        def run(lots):
+            lots.action_unassign_device()
+            # Large selections are queued: include the background processing
+            self.env['insulin.device.bulk.job']._cron_process_jobs()
+
+        self.run_sizes('action_unassign_device', prepare, run)
+
+    def test_action_scrap_device(self):
+        def prepare(size, prefix):
+            return self._generate_patients(size, prefix).primary_device_id
+
+        def run(lots):
+            lots.action_scrap_device()
+            self.env['insulin.device.bulk.job']._cron_process_jobs()
+
+        self.run_sizes('action_scrap_device', prepare, run)
+
+    def test_replace_device_wizard(self):
+        def prepare(size, prefix):
+            patients = self._generate_patients(size, prefix)
+            rma_lots = self._generate_lots(size, f'{prefix}-RMA', product=self.rma_product)
+            return self.env['insulin.replace.device.wizard'].create([{
+                'old_device_id': lot.id,
+                'new_device_id': rma_lot.id,
+                'replacement_reason': 'malfunction',
+            } for lot, rma_lot in zip(patients.primary_device_id, rma_lots)])
+
+        def run(wizards):
+            for wizard in wizards:
+                wizard.action_replace()
+
+        self.run_sizes('replace_device_wizard', prepare, run)
+
+    def test_holiday_pump_request_approve(self):
+        def prepare(size, prefix):
+            travel_start = self.today + timedelta(days=10)
+            travel_end = self.today + timedelta(days=24)
+            patients = self._generate_patients(size, prefix)
+            patients.write({'holiday_pump_return_date': travel_end})
+            holiday_lots = self._generate_lots(size, f'{prefix}-H', pump_type='holiday')
+            return self.env['insulin.holiday.pump.request'].create([{
+                'patient_name': patient.name,
+                'main_pump_serial': patient.primary_device_id.name,
+                'contact_phone': '+356 2100 0000',
+                'travel_start_date': travel_start,
+                'travel_end_date': travel_end,
+                'destination': 'Benchmark',
+                'patient_id': patient.id,
+                'holiday_pump_id': lot.id,
+            } for patient, lot in zip(patients, holiday_lots)])
+
+        def run(requests):
+            requests.action_approve()
+
+        self.run_sizes('holiday_pump_request_approve', prepare, run)
+
+    def test_cron_check_replacement_date_alerts(self):
+        def prepare(size, prefix):
+            return self._generate_patients(size, prefix, installation_date=self._installation_date_due_in(10))
+
+        def run(_patients):
+            self.env['stock.lot']._cron_check_replacement_date_alerts()
+
+        self.run_sizes('cron_check_replacement_date_alerts', prepare, run)
+
+    def test_cron_check_overdue_holiday_pumps(self):
+        def prepare(size, prefix):
+            return self._generate_patients(size, prefix, holiday_return_date=self.today - timedelta(days=3))
+
+        def run(_patients):
+            self.env['stock.lot']._cron_check_overdue_holiday_pumps()
+
+        self.run_sizes('cron_check_overdue_holiday_pumps', prepare, run)
@@ -0,0 +1,74 @@
+from odoo.exceptions import UserError
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestChatterBuffer(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ChatterBuffer = cls.env['insulin.chatter.buffer']
+        cls.patients = cls.env['res.partner'].create([
+            {'name': 'Buffer Patient A', 'is_patient': True},
+            {'name': 'Buffer Patient B', 'is_patient': True},
+        ])
+        cls.lot = cls.env['stock.lot'].create({
+            'name': 'BUFFER-0001',
+            'product_id': cls.env.ref('insulin_pumps_evercare.product_template_tslim_x2').product_variant_id.id,
+        })
+
+    def _run_precommit(self):
+        """Run the work deferred to commit time and return the new patient messages."""
+        Message = self.env['mail.message']
+        domain = [('model', '=', 'res.partner'), ('res_id', 'in', self.patients.ids)]
+        before = Message.search(domain)
+        self.env.cr.precommit.run()
+        self.env.flush_all()
+        return Message.search(domain) - before
+
+    def test_flush_one_message_per_record(self):
+        patient_a, patient_b = self.patients
+        self.ChatterBuffer._add_notes(self.patients, {
+            patient_a.id: ["Device SN A1 unassigned."],
+            patient_b.id: ["Device SN B1 unassigned."],
+        })
+        self.ChatterBuffer._add_note(patient_a, "Device SN A2 assigned as primary.")
+
+        messages = self._run_precommit()
+        self.assertEqual(len(messages), 2)
+        message_a = messages.filtered(lambda message: message.res_id == patient_a.id)
+        self.assertIn("A1 unassigned", message_a.body)
+        self.assertIn("A2 assigned", message_a.body)
+        self.assertEqual(message_a.message_type, 'notification')
+        self.assertFalse(self._run_precommit(), "Flushed notes must not be logged twice")
+
+    def test_savepoint_drops_rolled_back_notes(self):
+        patient = self.patients[0]
+        self.ChatterBuffer._add_note(patient, "Kept note.")
+        with self.assertRaises(UserError):
+            with self.ChatterBuffer._savepoint():
+                self.ChatterBuffer._add_note(patient, "Rolled back note.")
+                self.ChatterBuffer._add_note(self.patients[1], "Rolled back note.")
+                raise UserError("Batch failed")
+
+        messages = self._run_precommit()
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Kept note.", messages.body)
+        self.assertNotIn("Rolled back note.", messages.body)
+
+    def _pump_state_tracking(self):
+        self.env.cr.precommit.run()
+        self.env.flush_all()
+        return self.env['mail.tracking.value'].search([
+            ('mail_message_id.model', '=', 'stock.lot'),
+            ('mail_message_id.res_id', '=', self.lot.id),
+            ('field_id.name', '=', 'pump_state'),
+        ])
+
+    def test_skip_device_sync_write_not_tracked(self):
+        self.lot.with_context(skip_device_sync=True).write({'pump_state': 'scrapped'})
+        self.assertFalse(self._pump_state_tracking())
+
+        self.lot.write({'pump_state': 'available'})
+        self.assertTrue(self._pump_state_tracking(), "Regular writes are still tracked")
@@ -0,0 +1,82 @@
+import logging
+
+from odoo.tests import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('post_install', '-at_install', 'insulin_pumps_benchmark')
+class TestWriteAmplification(TransactionCase):
+    """Measure the cost of patient and serial changes on their stored copies.
+
+    The copies are refreshed by one set-based UPDATE per table, so the
+    number of queries must not grow with the number of linked records.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env.ref('insulin_pumps_evercare.product_template_tslim_x2').product_variant_id
+
+    def _create_patient_with_history(self, size):
+        """Patient with ``size`` devices, assignment logs and allocations."""
+        patient = self.env['res.partner'].create({'name': f'Benchmark Patient {size}', 'is_patient': True})
+        lots = self.env['stock.lot'].create([{
+            'name': f'BENCH-{size}-{i:05d}',
+            'product_id': self.product.id,
+        } for i in range(size)])
+        self.env['insulin.assignment.log'].create([{
+            'patient_id': patient.id,
+            'equipment_id': lot.id,
+            'assignment_type': 'primary',
+            'installation_date': '2020-01-01',
+            'replacement_date': '2020-02-01',
+        } for lot in lots])
+        # Allocations of years long past cannot clash with the current
+        # month's allocation of the patient
+        self.env['insulin.consumables.allocation'].create([{
+            'patient_id': patient.id,
+            'month': str(i % 12 + 1),
+            'year': 1000 + i // 12,
+            'quantity_allocated': 10,
+            'threshold': 13,
+        } for i in range(size)])
+        self.env.flush_all()
+        return patient, lots
+
+    def _count_queries(self, func):
+        self.env.flush_all()
+        before = self.env.cr.sql_log_count
+        func()
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - before
+
+    def test_patient_internal_id_change(self):
+        counts = {}
+        for size in (10, 200):
+            patient, _lots = self._create_patient_with_history(size)
+            new_id = f'BENCH-{size}'
+            counts[size] = self._count_queries(lambda: patient.write({'patient_internal_id': new_id}))
+            logs = self.env['insulin.assignment.log'].search([('patient_id', '=', patient.id)])
+            allocations = self.env['insulin.consumables.allocation'].search([('patient_id', '=', patient.id)])
+            self.assertEqual(set(logs.mapped('patient_internal_id')), {new_id})
+            self.assertEqual(set(allocations.mapped('patient_internal_id')), {new_id})
+        _logger.info("patient_internal_id change: queries per linked-record count %s", counts)
+        self.assertEqual(counts[10], counts[200], "Propagation cost must not depend on the history size")
+
+    def test_patient_rename(self):
+        counts = {}
+        for size in (10, 200):
+            patient, _lots = self._create_patient_with_history(size)
+            counts[size] = self._count_queries(lambda: patient.write({'name': f'Renamed {size}'}))
+            allocations = self.env['insulin.consumables.allocation'].search([('patient_id', '=', patient.id)])
+            self.assertTrue(all(name.startswith(f'Renamed {size} - ') for name in allocations.mapped('display_name')))
+        _logger.info("Patient rename: queries per linked-record count %s", counts)
+        self.assertEqual(counts[10], counts[200])
+
+    def test_serial_change(self):
+        patient, lots = self._create_patient_with_history(10)
+        lot = lots[0]
+        lot.write({'name': 'BENCH-RENAMED'})
+        log = self.env['insulin.assignment.log'].search([('equipment_id', '=', lot.id)])
+        self.assertEqual(log.equipment_serial, 'BENCH-RENAMED')